@@ -0,0 +1,153 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+import metrics
+
+METHODS = ("greedy", "lp", "exact")
+DEFAULT_TIME_LIMIT = float(os.environ.get("ALLOCATION_TIME_LIMIT", 2.0))
+
+
+def _books(weights, short_ratio):
+    """
+    Split weights into long-only books as DiscreteAllocation does.
+
+    Yields (normalized weights, fraction of the portfolio value allocated,
+    sign of the shares). Long-only weights are used as given; with shorts, the
+    longs get the full value and the shorts ``short_ratio`` of it.
+    """
+    if (weights >= 0).all():
+        yield weights, 1.0, 1
+        return
+    longs, shorts = weights[weights >= 0], -weights[weights < 0]
+    yield longs / longs.sum(), 1.0, 1
+    yield shorts / shorts.sum(), short_ratio, -1
+
+
+def _objective(shares, weights, prices, values):
+    """Allocation error of the LP: absolute deviation from target dollars plus leftover cash."""
+    held = shares * prices
+    return np.abs(weights * values[:, None] - held).sum(axis=1) + values - held.sum(axis=1)
+
+
+def greedy(weights, prices, values):
+    """
+    Greedy allocation of one long-only book for many portfolio values at once.
+
+    The same two rounds as DiscreteAllocation.greedy_portfolio, run as array
+    operations across every value: first the whole shares each weight affords,
+    then one share at a time of the affordable asset furthest below its
+    weight, until no asset under its weight is affordable.
+    Returns a (values x assets) share matrix and the leftover cash per value.
+    """
+    shares = np.floor(weights * values[:, None] / prices)
+    cash = values - shares @ prices
+    active = np.arange(len(values))
+    while len(active):
+        held = shares[active] * prices
+        total = held.sum(axis=1, keepdims=True)
+        current = np.divide(held, total, out=np.zeros_like(held), where=total > 0)
+        deficit = np.where((prices <= cash[active, None]) & (weights > current), weights - current, -np.inf)
+        best = deficit.argmax(axis=1)
+        buying = np.isfinite(deficit[np.arange(len(active)), best])
+        active, best = active[buying], best[buying]
+        shares[active, best] += 1
+        cash[active] -= prices[best]
+    return shares.astype(int), cash
+
+
+class _LPAllocation:
+    """Integer program of DiscreteAllocation.lp_portfolio with the portfolio value as a parameter, compiled once per book."""
+
+    def __init__(self, weights, prices):
+        import cvxpy as cp
+        self.value = cp.Parameter(nonneg=True)
+        self.shares = cp.Variable(len(prices), integer=True)
+        deviation = cp.Variable(len(prices))
+        leftover = self.value - prices @ self.shares
+        eta = weights * self.value - cp.multiply(self.shares, prices)
+        self.problem = cp.Problem(cp.Minimize(cp.sum(deviation) + leftover),
+                                  [eta <= deviation, eta >= -deviation, self.shares >= 0, leftover >= 0])
+
+    def solve(self, value, time_limit=None):
+        """Shares for one portfolio value, or None when no solution was found; the bool is True when proven optimal."""
+        import cvxpy as cp
+        self.value.value = value
+        options = {"time_limit": time_limit} if time_limit else {}
+        solver = "HIGHS" if "HIGHS" in cp.installed_solvers() else None
+        with warnings.catch_warnings():
+            # A solve stopped by the time limit warns that it may be inaccurate
+            warnings.simplefilter("ignore")
+            self.problem.solve(solver=solver, **(options if solver else {}))
+        metrics.record_solver("allocation", self.problem)
+        if self.shares.value is None:
+            return None, False
+        return np.rint(self.shares.value).astype(int), self.problem.status == "optimal"
+
+
+def _allocate_book(weights, prices, values, method, time_limit):
+    """Allocate one long-only book for every value; returns shares, leftover cash and the method used per value."""
+    w, p = weights.to_numpy(), prices.to_numpy()
+    if not len(w):
+        # No weight on this side (all-short, or all-zero weights): nothing to buy, the cash is left over
+        return np.zeros((len(values), 0), dtype=int), values.copy(), [method] * len(values)
+    greedy_shares, greedy_cash = greedy(w, p, values)
+    if method == "greedy":
+        return greedy_shares, greedy_cash, ["greedy"] * len(values)
+
+    lp = _LPAllocation(w, p)
+    greedy_error = _objective(greedy_shares, w, p, values)
+    shares, cash, used = greedy_shares.copy(), greedy_cash.copy(), []
+    for k, value in enumerate(values):
+        solution, optimal = lp.solve(value, None if method == "exact" else time_limit)
+        feasible = solution is not None and solution.min() >= 0 and solution @ p <= value + 1e-9
+        # A solve cut short by the time limit only replaces greedy if its incumbent is better
+        if feasible and (optimal or _objective(solution[None, :], w, p, values[k:k + 1])[0] < greedy_error[k]):
+            shares[k], cash[k] = solution, value - solution @ p
+            used.append(method if optimal else "lp_time_limit")
+        else:
+            used.append("greedy")
+    return shares, cash, used
+
+
+def allocate(weights, latest_prices, total_portfolio_values, method="lp", short_ratio=0.3, time_limit=None):
+    """
+    Convert continuous weights into whole shares for one or many portfolio values.
+
+    ``method`` is "greedy" (vectorized across all values), "lp" (the integer
+    program of DiscreteAllocation.lp_portfolio, stopped after ``time_limit``
+    seconds and falling back to greedy if that is better or nothing was
+    found) or "exact" (the integer program solved to optimality). Shorts are
+    handled like DiscreteAllocation: longs are allocated the full value and
+    shorts ``short_ratio`` of it; a side without weights buys nothing and
+    leaves its cash over.
+
+    Returns, per portfolio value (a list if ``total_portfolio_values`` is a
+    list), a dict with ``shares`` (ticker -> signed share count, zero
+    positions dropped), ``leftover`` cash and the ``method`` each book used.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown allocation method: {method}")
+    single = np.ndim(total_portfolio_values) == 0
+    values = np.atleast_1d(np.asarray(total_portfolio_values, dtype=float))
+    if (values <= 0).any():
+        raise ValueError("total_portfolio_value must be greater than zero")
+    weights = pd.Series(weights, dtype=float)
+    weights = weights[weights != 0]
+    prices = latest_prices[weights.index].astype(float)
+    time_limit = time_limit or DEFAULT_TIME_LIMIT
+    if short_ratio is None:
+        short_ratio = -weights[weights < 0].sum()
+
+    results = [{"shares": {}, "leftover": 0.0, "method": []} for _ in values]
+    with metrics.stage("allocation"):
+        for book, fraction, sign in _books(weights, short_ratio):
+            shares, cash, used = _allocate_book(book, prices[book.index], values * fraction, method, time_limit)
+            for result, row, leftover, book_method in zip(results, shares, cash, used):
+                result["shares"].update({t: sign * int(n) for t, n in zip(book.index, row) if n})
+                result["leftover"] += float(leftover)
+                result["method"].append(book_method)
+    for result in results:
+        # e.g. "lp", or "lp/greedy" when the long and short books ended differently
+        result["method"] = "/".join(dict.fromkeys(result["method"]))
+    return results[0] if single else results
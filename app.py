@@ -1,43 +1,64 @@
-from flask import Flask, request, jsonify
-from optimizer import download_prices, optimize_min_volatility, max_sharpe_with_sector_constraints, get_expected_returns, perform_discrete_allocation, maximize_return_given_risk, minimize_risk_given_return, efficient_semivariance, efficient_cvar, optimize_hrp 
+from flask import Flask, request, jsonify, Response
+from optimizer import download_prices, efficient_frontier_sweep, optimize_min_volatility, max_sharpe_with_sector_constraints, get_expected_returns, discrete_allocation, format_allocations, maximize_return_given_risk, minimize_risk_given_return, efficient_semivariance, efficient_cvar, optimize_hrp 
 from flask_cors import CORS
-from math import isnan
+from strategies import STRATEGIES, run_strategies, run_strategy
+from jobs import QueueFull, get_queue, run_job
+from response_cache import cached_response
+from backtest import run_backtest
+from resampling import resample
+from allocation import allocate
+import metrics
+from streaming import FORMATS, ProgressStream, negotiate
+from bulk import optimize_bulk, union_tickers
+from contextlib import closing
+from serialization import negotiate as negotiate_format, respond
+import risk_cache
   
 
 app = Flask(__name__)
-CORS(app)
-
-
-sector_mapper = {
-    "MSFT": "Tech",
-    "AMZN": "Consumer Discretionary",
-    "KO": "Consumer Staples",
-    "MA": "Financial Services",
-    "COST": "Consumer Staples",
-    "LUV": "Aerospace",
-    "XOM": "Energy",
-    "PFE": "Healthcare",
-    "JPM": "Financial Services",
-    "UNH": "Healthcare",
-    "ACN": "Misc",
-    "DIS": "Media",
-    "GILD": "Healthcare",
-    "F": "Auto",
-    "TSLA": "Auto"
-}
-
-sector_lower = {
-    "Consumer Staples": 0.1, # at least 10% to staples
-    "Tech": 0.05 # at least 5% to tech
-    # For all other sectors, it will be assumed there is no lower bound
-}
-
-sector_upper = {
-    "Tech": 0.2,
-    "Aerospace":0.1,
-    "Energy": 0.1,
-    "Auto":0.15
-}
+CORS(app, expose_headers=["ETag", "Server-Timing"])
+
+
+@app.before_request
+def start_timing():
+    metrics.start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    server_timing = metrics.finish_request(request.endpoint or "unknown", response.status_code)
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
+
+def render(response):
+    """Encode an endpoint's response in the format the Accept header asks for (see serialization.py)."""
+    return respond(response, negotiate_format(request.headers.get('Accept')))
+
+def risk_model_params():
+    """Covariance model options of the request: "ledoit_wolf" (default) or a PCA "factor" model with n_factors factors."""
+    return {"risk_model": request.json.get('risk_model', 'ledoit_wolf'), "n_factors": request.json.get('n_factors', 10)}
+
+def scenario_params():
+    """Scenario reduction options of the request for the CVaR and semivariance optimizers (see scenarios.reduce_scenarios)."""
+    return {"max_scenarios": request.json.get('max_scenarios'), "scenario_method": request.json.get('scenario_method', 'cluster')}
+
+def strategy_params():
+    """Targets and options of the request for strategies.run_strategy."""
+    return {
+        "target_volatility": request.json.get('target_volatility'),
+        "target_return": request.json.get('target_return'),
+        "target_cvar": request.json.get('target_cvar'),
+        "risk_model": request.json.get('risk_model'),
+        "n_factors": request.json.get('n_factors'),
+        "max_scenarios": request.json.get('max_scenarios'),
+        "scenario_method": request.json.get('scenario_method'),
+        "allocation_method": request.json.get('allocation_method'),
+        "sector_mapper": request.json.get('sector_mapper'),
+        "sector_lower": request.json.get('sector_lower'),
+        "sector_upper": request.json.get('sector_upper'),
+    }
 
 @app.route('/')
 def hello_world():
@@ -46,6 +67,7 @@ def hello_world():
 
 
 @app.route('/optimize_portfolio', methods=['POST'])
+@cached_response
 def optimize_portfolio():
     tickers = request.json.get('tickers')
     total_portfolio_value = request.json.get('total_portfolio_value')
@@ -53,84 +75,91 @@ def optimize_portfolio():
     
     response={}
 
-    prices, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers)
 
-    valid_tickers = [ticker for ticker in tickers if ticker not in errors]
     if valid_tickers:
         valid_prices = prices[valid_tickers]
         weights, _ = optimize_min_volatility(valid_prices)
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
     else:
-        weights, allocations, leftover = {}, {}, 0
+        weights, allocations, shares, leftover = {}, {}, {}, 0
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "errors": errors
     }
-    return jsonify(response)
+    return render(response)
 
 @app.route('/optimize_min_volatility', methods=['POST'])
+@cached_response
 def optimize_min_volatility_endpoint():
     tickers = request.json.get('tickers')
     total_portfolio_value = request.json.get('total_portfolio_value')
 
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
 #    valid_tickers = [ticker for ticker in tickers if ticker not in errors]
     response={}
     if valid_tickers:
         valid_prices = prices[valid_tickers]
-        weights, performance_data = optimize_min_volatility(valid_prices)
+        weights, performance_data = optimize_min_volatility(valid_prices, **risk_model_params())
         
         # Ensure weights only contain valid tickers
         weights = {ticker: weight for ticker, weight in weights.items() if ticker in valid_tickers}
         
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
         
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data = {}, {}, {}, 0, {}
 
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "performance": performance_data,
         "errors": errors
     }
     
 
-    return jsonify(response)
+    return render(response)
 
 @app.route('/max_sharpe_with_sector_constraints', methods=['POST'])
+@cached_response
 def max_sharpe_with_sector_constraints_endpoint():
     tickers = request.json.get('tickers')
     total_portfolio_value = request.json.get('total_portfolio_value', 10000)
     
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
     
     if valid_tickers:
         valid_prices = prices[valid_tickers]
-        weights, performance_data = max_sharpe_with_sector_constraints(valid_prices, sector_mapper, sector_lower, sector_upper)
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        weights, performance_data = max_sharpe_with_sector_constraints(
+            valid_prices, request.json.get('sector_mapper'), request.json.get('sector_lower'), request.json.get('sector_upper'))
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data = {}, {}, {}, 0, {}
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "performance": performance_data,
         "errors": errors
     }
-    return jsonify(response)
+    return render(response)
 
 @app.route('/maximize_return_given_risk', methods=['POST'])
+@cached_response
 def maximize_return_given_risk_endpoint():
     try:
         # Extract tickers, target volatility, and total portfolio value from JSON data
@@ -139,24 +168,25 @@ def maximize_return_given_risk_endpoint():
         total_portfolio_value = request.json.get('total_portfolio_value', 10000)
         
         # Download historical prices
-        prices, valid_tickers, errors = download_prices(tickers)
+        prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
         
         response = {}
         if valid_tickers:
             valid_prices = prices[valid_tickers]
             try:
                 # Optimize portfolio given the target volatility
-                weights, performance_data = maximize_return_given_risk(valid_prices, target_volatility)
+                weights, performance_data = maximize_return_given_risk(valid_prices, target_volatility, **risk_model_params())
                 
                 # Perform discrete allocation
-                allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+                shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+                allocations = format_allocations(shares)
                 performance_data = performance_data['MVO']
-                performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
                 
                 # Prepare response
                 response = {
                     "weights": weights,
                     "allocations": allocations,
+                    "shares": shares,
                     "leftover": leftover,
                     "performance": performance_data,
                     "errors": errors
@@ -166,108 +196,121 @@ def maximize_return_given_risk_endpoint():
                 response = {
                     "weights": {},
                     "allocations": {},
+                    "shares": {},
                     "leftover": 0,
                     "performance": {},
                     "errors": errors,
                     "message": str(ve)
                 }
         else:
-            weights, allocations, leftover, performance_data = {}, {}, 0, {}
+            weights, allocations, shares, leftover, performance_data = {}, {}, {}, 0, {}
             response = {
                 "weights": weights,
                 "allocations": allocations,
+                "shares": shares,
                 "leftover": leftover,
                 "performance": performance_data,
                 "errors": errors
             }
 
         # Return response as JSON
-        return jsonify(response)
+        return render(response)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/minimize_risk_given_return', methods=['POST'])
+@cached_response
 def minimize_risk_given_return_endpoint():
     tickers = request.json.get('tickers')
     target_return = request.json.get('target_return')
     total_portfolio_value = request.json.get('total_portfolio_value', 10000)
 
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
     
     if valid_tickers:
         valid_prices = prices[valid_tickers]
-        weights, performance_data = minimize_risk_given_return(valid_prices, target_return)
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        weights, performance_data = minimize_risk_given_return(valid_prices, target_return, **risk_model_params())
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data = {}, {}, {}, 0, {}
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "performance": performance_data,
         "errors": errors
     }
-    return jsonify(response)
+    return render(response)
 
 @app.route('/efficient_semivariance', methods=['POST'])
+@cached_response
 def efficient_semivariance_endpoint():
     tickers = request.json.get('tickers')
     target_return = request.json.get('target_return')
     total_portfolio_value = request.json.get('total_portfolio_value', 10000)
     
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
     
     if valid_tickers:
         valid_prices = prices[valid_tickers]
         mu = get_expected_returns(valid_prices)
-        weights, performance_data = efficient_semivariance(valid_prices, mu, benchmark=target_return)
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        weights, performance_data = efficient_semivariance(valid_prices, mu, benchmark=target_return, **scenario_params())
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
+        scenarios = performance_data['scenarios']
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data, scenarios = {}, {}, {}, 0, {}, None
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "performance": performance_data,
+        "scenarios": scenarios,
         "errors": errors
     }
-    return jsonify(response)
+    return render(response)
 
 @app.route('/efficient_cvar', methods=['POST'])
+@cached_response
 def efficient_cvar_endpoint():
     tickers = request.json.get('tickers')
     target_cvar = request.json.get('target_cvar')
     total_portfolio_value = request.json.get('total_portfolio_value', 10000)
    
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
     
     if valid_tickers:
         valid_prices = prices[valid_tickers]
         mu = get_expected_returns(valid_prices)
-        weights, performance_data = efficient_cvar(valid_prices, mu, target_cvar=target_cvar)
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        weights, performance_data = efficient_cvar(valid_prices, mu, target_cvar=target_cvar, **scenario_params())
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
+        scenarios = performance_data['scenarios']
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data, scenarios = {}, {}, {}, 0, {}, None
 
     response = {
         "weights": weights,
         "allocations": allocations,
+        "shares": shares,
         "leftover": leftover,
         "performance": performance_data,
+        "scenarios": scenarios,
         "errors": errors
     }
-    return jsonify(response)
+    return render(response)
 
 @app.route('/optimize_hrp', methods=['POST'])
+@cached_response
 def optimize_hrp_endpoint():
     """
     Endpoint to optimize portfolio using Hierarchical Risk Parity (HRP).
@@ -282,7 +325,7 @@ def optimize_hrp_endpoint():
     total_portfolio_value = request.json.get('total_portfolio_value', 10000)
     
     # Download historical prices
-    prices, valid_tickers, errors = download_prices(tickers)
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
         
     if valid_tickers:
         valid_prices = prices[valid_tickers]
@@ -291,23 +334,396 @@ def optimize_hrp_endpoint():
         weights, performance_data = optimize_hrp(valid_prices)
             
             # Perform discrete allocation
-        allocations, leftover = perform_discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value)
+        shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+        allocations = format_allocations(shares)
+        report = performance_data['hrp']
         performance_data = performance_data['MVO']
-        performance_data = {key: value if not isnan(value) else None for key, value in performance_data.items()}
     else:
-        weights, allocations, leftover, performance_data = {}, {}, 0, {}
+        weights, allocations, shares, leftover, performance_data, report = {}, {}, {}, 0, {}, {}
 
         # Prepare response
     response = {
             "weights": weights,
             "allocations": allocations,
+            "shares": shares,
             "leftover": leftover,
             "performance": performance_data,
+            "hrp": report,
             "errors": errors
         }
     
     # Return response as JSON
-    return jsonify(response)
+    return render(response)
+
+@app.route('/efficient_frontier', methods=['POST'])
+@cached_response
+def efficient_frontier_endpoint():
+    """
+    Trace the efficient frontier in one call.
+    Expects a JSON request containing tickers, target ("volatility" or "return"),
+    and either an explicit list of targets or num_points.
+    Returns the targets, a weights matrix (one row per point, columns in tickers
+    order) and the return, volatility and Sharpe ratio of every point.
+    """
+    tickers = request.json.get('tickers')
+    target = request.json.get('target', 'volatility')
+    targets = request.json.get('targets')
+    num_points = request.json.get('num_points', 20)
+
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
+
+    response = {"errors": errors}
+    if valid_tickers:
+        try:
+            frontier = efficient_frontier_sweep(prices[valid_tickers], targets=targets, target=target, num_points=num_points)
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+        # NaN marks infeasible points (sent as null in JSON)
+        performance = frontier["performance"]
+        response.update({
+            "tickers": frontier["tickers"],
+            "targets": frontier["targets"],
+            "weights": frontier["weights"],
+            "returns": performance[:, 0],
+            "volatility": performance[:, 1],
+            "sharpe": performance[:, 2],
+        })
+    return render(response)
+
+@app.route('/optimize_all', methods=['POST'])
+@cached_response
+def optimize_all_endpoint():
+    """
+    Run several strategies on one price download.
+    Expects a JSON request containing tickers, total_portfolio_value, an optional
+    list of strategies (defaults to all of them) and their targets
+    (target_volatility, target_return, target_cvar).
+    Returns each strategy's weights, allocations, leftover and performance.
+    """
+    tickers = request.json.get('tickers')
+    total_portfolio_value = request.json.get('total_portfolio_value', 10000)
+    names = request.json.get('strategies') or list(STRATEGIES)
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        return jsonify({"error": f"Unknown strategies: {', '.join(unknown)}"}), 400
+
+    params = strategy_params()
+
+    # Download once and estimate the shared risk inputs once for every strategy
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
+
+    if valid_tickers:
+        results = run_strategies(names, prices[valid_tickers], params, total_portfolio_value)
+    else:
+        results = {}
+
+    response = {
+        "results": results,
+        "errors": errors
+    }
+    return render(response)
+
+@app.route('/backtest', methods=['POST'])
+@cached_response
+def backtest_endpoint():
+    """
+    Walk-forward backtest of one strategy.
+    Expects a JSON request containing tickers, strategy (an optimization endpoint
+    name), frequency of rebalancing ("W", "M", "Q" or "Y"), lookback in trading
+    days and the strategy's target, if any.
+    Returns daily equity, returns and drawdown, per-rebalance weights and
+    turnover, and summary statistics.
+    """
+    strategy = request.json.get('strategy', 'optimize_hrp')
+    if strategy not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 400
+    tickers = request.json.get('tickers')
+    frequency = request.json.get('frequency', 'M')
+    lookback = request.json.get('lookback', 252)
+    params = strategy_params()
+
+    prices, valid_tickers, errors = download_prices(tickers)
+    if not valid_tickers:
+        return render({"errors": errors})
+    try:
+        result = run_backtest(prices[valid_tickers], strategy, frequency=frequency, lookback=lookback, params=params)
+    except ValueError as ve:
+        return jsonify({"error": str(ve), "errors": errors}), 400
+
+    response = {
+        "tickers": result["tickers"],
+        "dates": result["dates"].strftime("%Y-%m-%d").tolist(),
+        "equity": result["equity"],
+        "returns": result["returns"],
+        "drawdown": result["drawdown"],
+        "rebalance_dates": result["rebalance_dates"].strftime("%Y-%m-%d").tolist(),
+        "weights": result["weights"],
+        "turnover": result["turnover"],
+        "failures": result["failures"],
+        "summary": result["summary"],
+        "errors": errors
+    }
+    return render(response)
+
+@app.route('/resample', methods=['POST'])
+@cached_response
+def resample_endpoint():
+    """
+    Resampled (Michaud) portfolio of one strategy.
+    Expects a JSON request containing tickers, total_portfolio_value, strategy
+    (an optimization endpoint name), n_resamples, method ("bootstrap" or
+    "montecarlo"), seed, confidence, lookback and the strategy's target, if any.
+    Returns the average weights over the resamples and their allocations, the
+    weights on the original prices, and per ticker the standard deviation and
+    the confidence interval of its weight.
+    """
+    strategy = request.json.get('strategy', 'optimize_min_volatility')
+    if strategy not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 400
+    tickers = request.json.get('tickers')
+    total_portfolio_value = request.json.get('total_portfolio_value', 10000)
+    params = strategy_params()
+
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
+    if not valid_tickers:
+        return render({"errors": errors})
+    valid_prices = prices[valid_tickers]
+    from pypfopt.exceptions import OptimizationError
+    try:
+        result = resample(valid_prices, strategy, n_resamples=request.json.get('n_resamples', 200),
+                          method=request.json.get('method', 'bootstrap'), seed=request.json.get('seed', 0),
+                          confidence=request.json.get('confidence', 0.9), params=params)
+    except (ValueError, OptimizationError) as e:
+        return jsonify({"error": str(e), "errors": errors}), 400
+
+    weights = result["weights"].round(5).to_dict()
+    shares, leftover = discrete_allocation(weights, valid_prices, total_portfolio_value=total_portfolio_value, method=request.json.get('allocation_method', 'lp'))
+    response = {
+        "weights": weights,
+        "allocations": format_allocations(shares),
+        "shares": shares,
+        "leftover": leftover,
+        "point_weights": result["point"].round(5).to_dict(),
+        "std": result["std"].round(5).to_dict(),
+        "lower": result["lower"].round(5).to_dict(),
+        "upper": result["upper"].round(5).to_dict(),
+        "resamples": result["resamples"],
+        "failures": result["failures"],
+        "errors": errors
+    }
+    return render(response)
+
+@app.route('/allocate', methods=['POST'])
+@cached_response
+def allocate_endpoint():
+    """
+    Whole-share allocations of given weights for one or many account sizes.
+    Expects a JSON request containing weights ({ticker: weight}),
+    total_portfolio_values (a list, or a single total_portfolio_value),
+    allocation_method ("greedy", "lp" or "exact") and short_ratio.
+    Returns, per account size, the signed share counts, leftover cash and the
+    method that produced them.
+    """
+    weights = request.json.get('weights') or {}
+    total_portfolio_values = request.json.get('total_portfolio_values', request.json.get('total_portfolio_value', 10000))
+    method = request.json.get('allocation_method', 'lp')
+    short_ratio = request.json.get('short_ratio', 0.3)
+
+    prices, valid_tickers, errors = download_prices(list(weights), lookback=5)
+    missing = [ticker for ticker in weights if ticker not in valid_tickers]
+    if missing:
+        return jsonify({"error": f"No prices for: {', '.join(missing)}", "errors": errors}), 400
+    try:
+        allocations = allocate(weights, prices.iloc[-1], total_portfolio_values, method=method, short_ratio=short_ratio)
+    except ValueError as ve:
+        return jsonify({"error": str(ve), "errors": errors}), 400
+
+    return render({"allocations": allocations, "errors": errors})
+
+def export(response, frame, index):
+    """Encode an export's response as render does, or ``frame`` alone as an Arrow IPC table when asked for."""
+    fmt = negotiate_format(request.headers.get('Accept'), offered=("json", "msgpack", "arrow"))
+    return respond(response, fmt, frame=frame, index=index)
+
+@app.route('/export/prices', methods=['POST'])
+@cached_response
+def export_prices_endpoint():
+    """
+    Aligned price panel from the price store.
+    Expects a JSON request containing tickers and optionally lookback (trading
+    days), start_date and end_date.
+    Returns dates, tickers and a dates x tickers prices matrix (null before a
+    ticker's first price); as an Arrow IPC stream (Accept:
+    application/vnd.apache.arrow.stream) a table with a date column and one
+    column per ticker.
+    """
+    tickers = request.json.get('tickers')
+    dates = {key: request.json[key] for key in ('start_date', 'end_date') if request.json.get(key)}
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'), **dates)
+    if not valid_tickers:
+        return jsonify({"error": "No prices for any of the tickers", "errors": errors}), 400
+    prices = prices[valid_tickers]
+    response = {
+        "tickers": valid_tickers,
+        "dates": prices.index.strftime("%Y-%m-%d").tolist(),
+        "prices": prices.to_numpy(dtype=float),
+        "errors": errors
+    }
+    return export(response, prices, "date")
+
+@app.route('/export/covariance', methods=['POST'])
+@cached_response
+def export_covariance_endpoint():
+    """
+    Annualized Ledoit-Wolf covariance matrix, as the optimizers use it.
+    Expects a JSON request containing tickers and optionally lookback.
+    Returns tickers and a tickers x tickers covariance matrix; as an Arrow IPC
+    stream a table with a ticker column and one column per ticker.
+    """
+    tickers = request.json.get('tickers')
+    prices, valid_tickers, errors = download_prices(tickers, lookback=request.json.get('lookback'))
+    if not valid_tickers:
+        return jsonify({"error": "No prices for any of the tickers", "errors": errors}), 400
+    covariance = risk_cache.get_covariance(prices[valid_tickers])
+    response = {"tickers": valid_tickers, "covariance": covariance.to_numpy(), "errors": errors}
+    return export(response, covariance, "ticker")
+
+@app.route('/jobs', methods=['POST'])
+def submit_job_endpoint():
+    """
+    Queue a long-running optimization instead of solving it within the request.
+    Expects a JSON request containing strategy (an optimization endpoint name),
+    tickers, total_portfolio_value, lookback and the strategy's target, if any.
+    Returns the job id to poll on /jobs/<id>.
+    """
+    strategy = request.json.get('strategy')
+    if strategy not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 400
+    tickers = request.json.get('tickers')
+    total_portfolio_value = request.json.get('total_portfolio_value', 10000)
+    params = strategy_params()
+
+    try:
+        job_id = get_queue().submit(run_job, strategy, tickers, params, total_portfolio_value, request.json.get('lookback'))
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify({"id": job_id, "status": "queued"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status_endpoint(job_id):
+    """Return a job's status, and its result once done."""
+    status = get_queue().status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return render(status)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_endpoint(job_id):
+    """Cancel a queued job, or discard the result of a running one."""
+    if not get_queue().cancel(job_id):
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return render(get_queue().status(job_id))
+
+@app.route('/stream/<strategy>', methods=['POST'])
+def stream_endpoint(strategy):
+    """
+    Run one strategy, streaming its progress instead of waiting for the result.
+    Expects the same JSON request as the strategy's endpoint. Responds with
+    NDJSON, or Server-Sent Events when the Accept header asks for
+    text/event-stream, one event per line/message:
+    - "start" with the tickers requested,
+    - "ticker" per ticker as it is loaded, with its row count or error,
+    - "stage" as each stage (store_read, fetch, panel, risk models, solve,
+      allocation) starts and finishes,
+    - "result" with the same payload as the strategy's endpoint, or "error",
+    - "heartbeat" while nothing else happens.
+    Disconnecting stops the work at its next stage boundary.
+    """
+    if strategy not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {strategy}"}), 404
+    tickers = request.json.get('tickers') or []
+    total_portfolio_value = request.json.get('total_portfolio_value', 10000)
+    lookback = request.json.get('lookback')
+    params = strategy_params()
+
+    def work(emit):
+        emit("start", strategy=strategy, tickers=tickers)
+        loaded = []
+
+        def on_result(ticker, prices, error):
+            loaded.append(ticker)
+            progress = {"ticker": ticker, "done": len(loaded), "total": len(tickers)}
+            if error is None:
+                emit("ticker", rows=len(prices), **progress)
+            else:
+                emit("ticker", error=str(error), **progress)
+
+        prices, valid_tickers, errors = download_prices(tickers, lookback=lookback, on_result=on_result)
+        if not valid_tickers:
+            emit("result", weights={}, allocations={}, shares={}, leftover=0, performance={}, errors=errors)
+            return
+        result = run_strategy(strategy, prices[valid_tickers], params, total_portfolio_value)
+        emit("result", errors=errors, **result)
+
+    fmt = negotiate(request.headers.get('Accept'))
+    # Proxies such as nginx must not buffer the events
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(ProgressStream(work, fmt), mimetype=FORMATS[fmt], headers=headers)
+
+@app.route('/optimize_bulk', methods=['POST'])
+def optimize_bulk_endpoint():
+    """
+    Optimize many accounts on one price download.
+    Expects a JSON request containing accounts, a list of {id, tickers,
+    total_portfolio_value} with optional per-account strategy and targets,
+    plus request-wide defaults for strategy (optimize_min_volatility), the
+    targets and options, and lookback.
+    Streams NDJSON (or Server-Sent Events, as /stream/<strategy>): "start",
+    "prices" once the union panel is built, "stage" events, one "account"
+    event per account as it finishes (in completion order, carrying its id
+    and the payload of its strategy's endpoint), then "done".
+    """
+    default_strategy = request.json.get('strategy', 'optimize_min_volatility')
+    default_value = request.json.get('total_portfolio_value', 10000)
+    accounts = []
+    for i, account in enumerate(request.json.get('accounts') or []):
+        strategy = account.get('strategy', default_strategy)
+        if strategy not in STRATEGIES:
+            return jsonify({"error": f"Unknown strategy for account {account.get('id', i)}: {strategy}"}), 400
+        accounts.append({**account, "id": account.get('id', i), "strategy": strategy, "tickers": account.get('tickers') or [],
+                         "total_portfolio_value": account.get('total_portfolio_value', default_value)})
+    lookback = request.json.get('lookback')
+    params = strategy_params()
+
+    def work(emit):
+        tickers = union_tickers(accounts)
+        emit("start", accounts=len(accounts), tickers=len(tickers))
+        prices, valid_tickers, errors = download_prices(tickers, lookback=lookback)
+        emit("prices", tickers=len(valid_tickers), rows=len(prices), errors=errors)
+        runnable = []
+        for account in accounts:
+            account_errors = {ticker: errors[ticker] for ticker in account["tickers"] if ticker in errors}
+            if any(ticker in valid_tickers for ticker in account["tickers"]):
+                runnable.append((account, account_errors))
+            else:
+                emit("account", id=account["id"], weights={}, allocations={}, shares={}, leftover=0, performance={},
+                     message="No prices for any of the account's tickers", errors=account_errors)
+        with closing(optimize_bulk([account for account, _ in runnable], prices[valid_tickers], params)) as results:
+            for i, result in results:
+                account, account_errors = runnable[i]
+                emit("account", id=account["id"], errors=account_errors, **result)
+        emit("done", accounts=len(accounts))
+
+    fmt = negotiate(request.headers.get('Accept'))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(ProgressStream(work, fmt), mimetype=FORMATS[fmt], headers=headers)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-stage latency histograms, solver statistics and cache counters of this worker, in Prometheus format."""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import risk_cache
+from incremental_risk import RunningCovariance
+from strategies import STRATEGIES, get_pool
+
+
+def rebalance_positions(index, frequency="M", lookback=252):
+    """Row positions of the last trading day of each ``frequency`` period that has ``lookback`` rows of history."""
+    positions = pd.Series(np.arange(len(index)), index=index).groupby(index.to_period(frequency)).last().to_numpy()
+    return positions[positions >= lookback - 1]
+
+
+def _rebalance_weights(strategy, window, risk_inputs, params, tickers):
+    """Weights of ``strategy`` on one lookback window, aligned to ``tickers``; tickers not in the window get none."""
+    if window.empty:
+        return None, "No ticker has prices over the whole lookback window"
+    # Inputs come from the backtest's single pass over the full panel
+    risk_cache.prime(window, risk_inputs)
+    try:
+        weights, _ = STRATEGIES[strategy][0](window, params)
+    except Exception as e:
+        return None, str(e)
+    return np.array([weights.get(ticker, 0.0) for ticker in tickers]), None
+
+
+def _run_rebalances(strategy, windows, params, tickers, parallel):
+    if not parallel or len(windows) < 2:
+        return [_rebalance_weights(strategy, window, risk_inputs, params, tickers) for window, risk_inputs in windows]
+    pool = get_pool()
+    futures = [pool.submit(_rebalance_weights, strategy, window, risk_inputs, params, tickers) for window, risk_inputs in windows]
+    return [future.result() for future in futures]
+
+
+def run_backtest(prices, strategy, frequency="M", lookback=252, params=None, parallel=True):
+    """
+    Walk-forward backtest of a strategy from strategies.STRATEGIES.
+
+    At the close of the last trading day of every ``frequency`` period the
+    strategy is re-run on the trailing ``lookback`` days, independently for
+    every rebalance date so they run in parallel on the strategy process pool.
+    The shrunk covariance of each window is rolled forward from the previous
+    one with RunningCovariance rather than re-estimated.
+    Each rebalance only considers the tickers priced over its whole window;
+    the others (e.g. not yet listed) get no weight.
+    Between rebalances holdings drift with prices; anything the weights do not
+    invest (1 - sum of weights, e.g. for market-neutral portfolios) is held as
+    cash. When a rebalance fails the previous weights are kept.
+
+    Returns the daily equity curve, returns and drawdown, and per rebalance
+    the weights and turnover (measured against the drifted weights held just
+    before rebalancing), plus summary statistics.
+    """
+    params = params or {}
+    positions = rebalance_positions(prices.index, frequency, lookback)
+    if len(positions) == 0:
+        raise ValueError(f"Not enough history for a {lookback}-day lookback")
+
+    # One vectorized pass for returns; every window slices it instead of recomputing
+    returns = prices.pct_change(fill_method=None)
+    windows = []
+    stats = None
+    for k, p in enumerate(positions):
+        window = prices.iloc[p - lookback + 1:p + 1]
+        # Only tickers priced over the whole window: missing returns would count as riskless zeros
+        listed = window.columns[window.notna().all().to_numpy()]
+        window_returns = returns.iloc[p - lookback + 2:p + 1]
+        risk_inputs = {"returns": window_returns[listed]}
+        if "ledoit_wolf" in STRATEGIES[strategy][1]:
+            # Roll the covariance statistics forward instead of re-estimating each window
+            previous = positions[k - 1] if k else None
+            if stats is None or p - previous >= lookback - 1:
+                stats = RunningCovariance.from_returns(window_returns)
+            else:
+                stats.update(returns.iloc[previous + 1:p + 1])
+                stats.remove(returns.iloc[previous - lookback + 2:p - lookback + 2])
+            risk_inputs["ledoit_wolf"] = stats.subset(listed).ledoit_wolf()
+        windows.append((window[listed], risk_inputs))
+    results = _run_rebalances(strategy, windows, params, list(prices.columns), parallel)
+
+    n_tickers = prices.shape[1]
+    weights = np.zeros((len(positions), n_tickers))
+    failures = []
+    for k, (w, error) in enumerate(results):
+        if w is None:
+            failures.append({"date": str(prices.index[positions[k]].date()), "message": error})
+            w = weights[k - 1] if k else np.zeros(n_tickers)
+        weights[k] = w
+
+    # Cumulative growth of each asset; growth between two dates is a ratio of rows
+    growth = np.cumprod(1 + np.nan_to_num(returns.to_numpy()[positions[0]:]), axis=0)
+    rebalance_rows = positions - positions[0]
+    days = np.arange(len(growth))
+    segment = np.searchsorted(rebalance_rows, days, side="right") - 1
+    relative = growth / growth[rebalance_rows[segment]]
+
+    # Value of each segment's portfolio relative to its rebalance date, cash included
+    segment_value = 1 + ((relative - 1) * weights[segment]).sum(axis=1)
+    relative_end = growth[rebalance_rows[1:]] / growth[rebalance_rows[:-1]]
+    segment_end = 1 + ((relative_end - 1) * weights[:-1]).sum(axis=1)
+    equity = np.concatenate([[1.0], np.cumprod(segment_end)])[segment] * segment_value
+
+    daily_returns = np.concatenate([[0.0], equity[1:] / equity[:-1] - 1])
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+
+    # Drifted weights just before each rebalance, against which turnover is traded
+    drifted = np.zeros_like(weights)
+    drifted[1:] = weights[:-1] * relative_end / segment_end[:, None]
+    turnover = np.abs(weights - drifted).sum(axis=1)
+
+    periods_per_year = 252
+    years = len(equity) / periods_per_year
+    annual_return = equity[-1] ** (1 / years) - 1 if years > 0 else np.nan
+    annual_volatility = daily_returns[1:].std() * np.sqrt(periods_per_year)
+    print(f'-----Backtested {strategy} over {len(positions)} rebalances-----')
+
+    return {
+        "tickers": list(prices.columns),
+        "dates": prices.index[positions[0]:],
+        "equity": equity,
+        "returns": daily_returns,
+        "drawdown": drawdown,
+        "rebalance_dates": prices.index[positions],
+        "weights": weights,
+        "turnover": turnover,
+        "failures": failures,
+        "summary": {
+            "Total return": equity[-1] - 1,
+            "Annual return": annual_return,
+            "Annual volatility": annual_volatility,
+            "Sharpe Ratio": annual_return / annual_volatility if annual_volatility else np.nan,
+            "Max drawdown": drawdown.min(),
+            "Average turnover": turnover.mean(),
+        },
+    }
@@ -0,0 +1,242 @@
+"""
+Offline benchmark suite.
+
+Times each stage of the optimization pipeline on synthetic correlated price
+panels over a grid of ticker counts and history lengths, without touching the
+network:
+
+    python benchmark.py --tickers 10,50,200 --days 1000,5000 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+
+Results are written as JSON; ``--compare`` reports the stages that got slower
+than a previous run by more than ``--threshold`` and exits non-zero if any did.
+"""
+import io
+import sys
+import json
+import time
+import zlib
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+
+END_DATE = "2023-01-01"
+
+
+class SyntheticProvider:
+    """
+    Deterministic price provider for the price store, a stand-in for YahooProvider.
+
+    Every ticker follows a ``n_factors`` factor model over one business-day
+    calendar: shared factor returns (fixed by ``seed``) plus loadings and
+    idiosyncratic noise seeded by the ticker name, so any ticker name yields
+    the same correlated series on every call and every machine. Histories
+    start ``n_days`` business days before ``end``.
+    """
+
+    def __init__(self, n_days=5000, n_factors=3, seed=0, end=END_DATE):
+        self.seed = seed
+        self.calendar = pd.bdate_range(end=pd.Timestamp(end) - pd.Timedelta(days=1), periods=n_days + 1)
+        rng = np.random.default_rng(seed)
+        self.factor_returns = rng.normal(0.0003, 0.01, (n_days, n_factors))
+
+    def series(self, ticker):
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        loadings = rng.normal(0.6, 0.4, self.factor_returns.shape[1])
+        noise = rng.normal(0, rng.uniform(0.005, 0.02), len(self.factor_returns))
+        returns = np.clip(self.factor_returns @ loadings + noise, -0.5, None)
+        prices = rng.uniform(10, 500) * np.concatenate([[1.0], np.cumprod(1 + returns)])
+        return pd.Series(prices, index=self.calendar, name=ticker)
+
+    def fetch(self, ticker, start_date, end_date):
+        close = self.series(ticker)
+        return close[(close.index >= pd.Timestamp(start_date)) & (close.index < pd.Timestamp(end_date))]
+
+
+def synthetic_tickers(n_tickers):
+    return [f"SYN{i:04d}" for i in range(n_tickers)]
+
+
+def synthetic_prices(n_tickers, n_days, seed=0):
+    """A panel of ``n_tickers`` synthetic price series over ``n_days`` + 1 business days."""
+    provider = SyntheticProvider(n_days=n_days, seed=seed)
+    prices = pd.concat([provider.series(t) for t in synthetic_tickers(n_tickers)], axis=1)
+    # Key risk models on a data version, as download_prices does, instead of hashing the panel
+    prices.attrs["data_version"] = f"synthetic-{seed}-{n_tickers}-{n_days}"
+    return prices
+
+
+def synthetic_sectors(tickers, n_sectors=5):
+    """Round-robin sector mapper with bounds loose enough to stay feasible."""
+    sector_mapper = {ticker: f"Sector{i % n_sectors}" for i, ticker in enumerate(tickers)}
+    sector_lower = {"Sector0": 0.05}
+    sector_upper = {"Sector1": 0.4, "Sector2": 0.4}
+    return sector_mapper, sector_lower, sector_upper
+
+
+def time_stage(fn, repeat=3, setup=None):
+    """Best and median wall time of ``fn()`` over ``repeat`` runs, with ``setup()`` run untimed before each."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # The optimizers print their performance; keep it out of the timings' output
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": float(np.median(timings)), "repeat": repeat}
+
+
+def stages(n_tickers, n_days, store_root):
+    """(name, function, setup) for every stage benchmarked on one grid point."""
+    import optimizer
+    import price_store
+    import risk_cache
+    import response_cache
+    from app import app
+
+    prices = synthetic_prices(n_tickers, n_days)
+    tickers = list(prices.columns)
+    sector_mapper, sector_lower, sector_upper = synthetic_sectors(tickers)
+    store = price_store.PriceStore(store_root, SyntheticProvider(n_days=n_days))
+    start_date = str(prices.index[0].date())
+
+    # Warm caches so every optimizer stage times the solve alone
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimizer.download_prices(tickers, start_date, END_DATE, store=store)
+        mu = optimizer.get_expected_returns(prices)
+        S = risk_cache.get_covariance(prices)
+        equal_weight = np.full(n_tickers, 1 / n_tickers)
+        target_volatility = float(np.sqrt(equal_weight @ S.to_numpy() @ equal_weight)) * 1.1
+        returns = risk_cache.get_returns(prices).dropna()
+        losses = -(returns.to_numpy() @ equal_weight)
+        target_cvar = float(np.mean(np.sort(losses)[-max(1, len(losses) // 20):])) * 1.1
+        weights, _ = optimizer.optimize_min_volatility(prices)
+
+    client = app.test_client()
+    payload = {"tickers": tickers, "total_portfolio_value": 100000, "target_volatility": target_volatility,
+               "target_return": 0.05, "target_cvar": target_cvar}
+
+    def post(path):
+        def request():
+            response = client.post(path, json=payload)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+        return request
+
+    def fresh_risk_cache():
+        risk_cache.clear_cache()
+        risk_cache.get_returns(prices)
+
+    def use_store():
+        price_store.set_store(store)
+        response_cache.clear_cache()
+
+    yield "download_prices", lambda: optimizer.download_prices(tickers, start_date, END_DATE, store=store), None
+    yield "capm_return", lambda: risk_cache.get_capm_return(prices), fresh_risk_cache
+    yield "ledoit_wolf", lambda: risk_cache.get_covariance(prices), fresh_risk_cache
+    # Re-warm what the clears above dropped
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimizer.get_expected_returns(prices)
+        risk_cache.get_covariance(prices)
+    yield "optimize_min_volatility", lambda: optimizer.optimize_min_volatility(prices), None
+    yield "optimize_min_volatility[factor]", lambda: optimizer.optimize_min_volatility(prices, risk_model="factor"), None
+    yield "max_sharpe_with_sector_constraints", lambda: optimizer.max_sharpe_with_sector_constraints(
+        prices, sector_mapper, sector_lower, sector_upper), None
+    yield "maximize_return_given_risk", lambda: optimizer.maximize_return_given_risk(prices, target_volatility), None
+    yield "minimize_risk_given_return", lambda: optimizer.minimize_risk_given_return(prices, 0.05), None
+    yield "efficient_semivariance", lambda: optimizer.efficient_semivariance(prices, mu), None
+    yield "efficient_cvar", lambda: optimizer.efficient_cvar(prices, mu, target_cvar), None
+    yield "optimize_hrp", lambda: optimizer.optimize_hrp(prices), None
+    yield "efficient_frontier_sweep", lambda: optimizer.efficient_frontier_sweep(prices, num_points=10), None
+    yield "perform_discrete_allocation", lambda: optimizer.perform_discrete_allocation(weights, prices, total_portfolio_value=100000), None
+    yield "discrete_allocation[greedy]", lambda: optimizer.discrete_allocation(weights, prices, total_portfolio_value=100000, method="greedy"), None
+    for path in ("/optimize_portfolio", "/optimize_min_volatility", "/maximize_return_given_risk", "/minimize_risk_given_return",
+                 "/efficient_semivariance", "/efficient_cvar", "/optimize_hrp"):
+        yield f"endpoint{path}", post(path), use_store
+
+
+def run(ticker_counts, day_counts, repeat=3, only=None):
+    """Benchmark every stage (or those whose name contains one of ``only``) on every grid point."""
+    import risk_cache
+
+    results = []
+    for n_tickers in ticker_counts:
+        for n_days in day_counts:
+            with tempfile.TemporaryDirectory() as store_root:
+                risk_cache.clear_cache()
+                for name, fn, setup in stages(n_tickers, n_days, store_root):
+                    if only and not any(part in name for part in only):
+                        continue
+                    result = {"stage": name, "n_tickers": n_tickers, "n_days": n_days}
+                    try:
+                        result.update(time_stage(fn, repeat, setup))
+                    except Exception as e:
+                        result["error"] = str(e)
+                    results.append(result)
+                    timing = f"{result['best'] * 1000:10.1f} ms" if "best" in result else f"failed: {result['error']}"
+                    print(f"{name:40s} N={n_tickers:<5d} T={n_days:<6d} {timing}", file=sys.stderr)
+    return results
+
+
+def environment():
+    import cvxpy
+    import pypfopt
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cvxpy": cvxpy.__version__,
+        "pypfopt": getattr(pypfopt, "__version__", None),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold=1.2):
+    """Stages whose best time grew by more than ``threshold`` times against a baseline run."""
+    previous = {(r["stage"], r["n_tickers"], r["n_days"]): r for r in baseline["results"] if "best" in r}
+    regressions = []
+    for r in results:
+        before = previous.get((r["stage"], r["n_tickers"], r["n_days"]))
+        if before is None or "best" not in r:
+            continue
+        ratio = r["best"] / before["best"]
+        print(f"{r['stage']:40s} N={r['n_tickers']:<5d} T={r['n_days']:<6d} {ratio:6.2f}x")
+        if ratio > threshold:
+            regressions.append({**r, "baseline": before["best"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", default="10,50,200", help="comma-separated ticker counts")
+    parser.add_argument("--days", default="1000,5000", help="comma-separated history lengths in business days")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", default=None, help="comma-separated substrings of the stages to run")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    results = run([int(n) for n in args.tickers.split(",")], [int(n) for n in args.days.split(",")],
+                  repeat=args.repeat, only=args.only.split(",") if args.only else None)
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"Regression: {r['stage']} N={r['n_tickers']} T={r['n_days']} "
+                  f"{r['baseline'] * 1000:.1f} ms -> {r['best'] * 1000:.1f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+import factor_model
+import risk_cache
+from strategies import STRATEGIES, WORKERS, get_pool, run_strategy
+
+# Account fields that override the request-wide strategy params
+ACCOUNT_PARAMS = ("target_volatility", "target_return", "target_cvar", "risk_model", "n_factors",
+                  "max_scenarios", "scenario_method", "allocation_method")
+
+
+def union_tickers(accounts):
+    return list(dict.fromkeys(ticker for account in accounts for ticker in account["tickers"]))
+
+
+def run_account(strategy, prices, returns, stats, params, total_portfolio_value):
+    """
+    Run one account's strategy on its slice of the union panel.
+
+    The Ledoit-Wolf covariance comes from ``stats``, the union's running
+    statistics cut down to the account's tickers, and the CAPM returns from
+    the account's returns, so the account's inputs are exactly those of its
+    own columns without another pass over the union's history.
+    """
+    needed = STRATEGIES[strategy][1]
+    inputs = {"returns": returns}
+    if "ledoit_wolf" in needed:
+        inputs["ledoit_wolf"] = stats.ledoit_wolf()
+    if "capm_return" in needed:
+        inputs["capm_return"] = factor_model.capm_return(returns)
+    return run_strategy(strategy, prices, params, total_portfolio_value, inputs)
+
+
+def optimize_bulk(accounts, prices, params, parallel=True):
+    """
+    Optimize many accounts on one union price panel, yielding ``(index, result)`` as each finishes.
+
+    ``accounts`` are dicts with ``tickers``, ``strategy``,
+    ``total_portfolio_value`` and optional per-account overrides of
+    ``params`` (see ACCOUNT_PARAMS). ``prices`` holds the union of their
+    tickers; the returns and the running covariance statistics are estimated
+    once on it and each account gets its columns and its sub-matrices. The
+    accounts run on the strategies process pool. Closing the generator early
+    leaves the accounts not submitted yet unstarted.
+    """
+    returns = risk_cache.get_returns(prices)
+    if any("ledoit_wolf" in STRATEGIES[account["strategy"]][1] for account in accounts):
+        stats = risk_cache.get_running_covariance(prices)
+    else:
+        stats = None
+
+    def job(account):
+        tickers = [ticker for ticker in account["tickers"] if ticker in prices.columns]
+        account_params = {**params, **{key: account[key] for key in ACCOUNT_PARAMS if key in account}}
+        # Days none of the account's tickers traded (e.g. before the youngest union ticker's peers existed)
+        # are not in the account's own returns; they only counted in the union statistics as zero rows
+        account_returns = returns[tickers]
+        observed = account_returns.notna().any(axis=1).to_numpy()
+        account_stats = None
+        if stats:
+            account_stats = stats.subset(tickers)
+            if not observed.all():
+                account_stats.remove(account_returns[~observed])
+        return (account["strategy"], prices[tickers], account_returns[observed], account_stats,
+                account_params, account["total_portfolio_value"])
+
+    if not parallel or len(accounts) < 2:
+        for i, account in enumerate(accounts):
+            yield i, run_account(*job(account))
+        return
+
+    pool = get_pool()
+    # Only a few accounts per worker are sliced and queued at a time, so memory stays flat however many accounts there are
+    limit = 2 * WORKERS
+    pending = iter(enumerate(accounts))
+    futures = {}
+    try:
+        while True:
+            for i, account in pending:
+                futures[pool.submit(run_account, *job(account))] = i
+                if len(futures) >= limit:
+                    break
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures.pop(future), future.result()
+    finally:
+        for future in futures:
+            future.cancel()
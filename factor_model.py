@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import metrics
+
+
+class FactorRiskModel:
+    """
+    Covariance in factor form, B F B' + diag(D).
+
+    ``loadings`` B is N x k, ``factor_cov`` F is k x k and ``specific_var`` D
+    has length N, all annualized. Nothing of size N x N is ever formed.
+    """
+
+    def __init__(self, tickers, loadings, factor_cov, specific_var):
+        self.tickers = list(tickers)
+        self.loadings = loadings
+        self.factor_cov = factor_cov
+        self.specific_var = specific_var
+
+    def variance(self, weights):
+        """Portfolio variance of a weight vector, in O(N * k)."""
+        exposure = self.loadings.T @ weights
+        return exposure @ self.factor_cov @ exposure + (self.specific_var * weights ** 2).sum()
+
+    def risk_expression(self, w):
+        """cvxpy expression for the variance of weight variable ``w``."""
+        import cvxpy as cp
+        factor_root = np.linalg.cholesky(self.factor_cov + 1e-12 * np.eye(len(self.factor_cov)))
+        return cp.sum_squares(factor_root.T @ (self.loadings.T @ w)) + cp.sum_squares(cp.multiply(np.sqrt(self.specific_var), w))
+
+
+def pca_factor_model(returns, n_factors=10, frequency=252):
+    """
+    Statistical factor model from the top principal components of daily returns.
+
+    Uses a randomized truncated SVD of the T x N returns, so cost and memory
+    stay O(T * N * k); missing returns count as zero.
+    """
+    from sklearn.utils.extmath import randomized_svd
+    X = np.nan_to_num(returns.to_numpy())
+    X = X - X.mean(axis=0)
+    n_obs, n_tickers = X.shape
+    n_factors = max(1, min(n_factors, n_obs - 1, n_tickers))
+    _, singular_values, components = randomized_svd(X, n_factors, random_state=0)
+
+    loadings = components.T
+    # Principal component returns are uncorrelated, so their covariance is diagonal
+    factor_var = singular_values ** 2 / (n_obs - 1)
+    total_var = (X ** 2).sum(axis=0) / (n_obs - 1)
+    explained_var = (loadings ** 2) @ factor_var
+    specific_var = np.maximum(total_var - explained_var, 1e-10)
+    return FactorRiskModel(returns.columns, loadings, np.diag(factor_var) * frequency, specific_var * frequency)
+
+
+def capm_return(returns, frequency=252):
+    """
+    CAPM expected returns as in ``expected_returns.capm_return``, without its N x N covariance.
+
+    The betas against the equally-weighted market only need each ticker's
+    covariance with the market, which is O(T * N).
+    """
+    X = returns.to_numpy()
+    market = np.nanmean(X, axis=1)
+    observed = ~np.isnan(X)
+    counts = observed.sum(axis=0)
+    # Pairwise-complete covariance with the market, as DataFrame.cov computes it
+    Xz = np.where(observed, X, 0.0)
+    market_by_ticker = np.where(observed, market[:, None], 0.0)
+    mean_x = Xz.sum(axis=0) / counts
+    mean_market = market_by_ticker.sum(axis=0) / counts
+    cov_market = (np.where(observed, (Xz - mean_x) * (market[:, None] - mean_market), 0.0)).sum(axis=0) / (counts - 1)
+    betas = cov_market / np.nanvar(market, ddof=1)
+    market_return = np.nanprod(1 + market) ** (frequency / np.count_nonzero(~np.isnan(market))) - 1
+    return pd.Series(betas * market_return, index=returns.columns)
+
+
+def _performance(model, weights, mu, title):
+    volatility = np.sqrt(model.variance(weights))
+    expected_return = float(mu @ weights) if mu is not None else np.nan
+    sharpe = expected_return / volatility if mu is not None else np.nan
+    print(title)
+    if mu is not None:
+        print(f"Expected annual return: {100 * expected_return:.1f}%")
+    print(f"Annual volatility: {100 * volatility:.1f}%")
+    if mu is not None:
+        print(f"Sharpe Ratio: {sharpe:.2f}")
+    portfolio_performance = pd.DataFrame([expected_return, volatility, sharpe],
+                                         index=["Expected annual return", "Annual volatility", "Sharpe Ratio"],
+                                         columns=["MVO"])
+    return portfolio_performance.to_dict()
+
+
+def _solve(objective, constraints, name):
+    import cvxpy as cp
+    problem = cp.Problem(objective, constraints)
+    with metrics.stage("solve"):
+        problem.solve()
+    metrics.record_solver(name, problem)
+    if problem.status not in {"optimal", "optimal_inaccurate"}:
+        raise ValueError(f"Solver status: {problem.status}")
+
+
+def optimize_min_volatility(model):
+    """Long/short (weights in [-1, 1]) minimum variance portfolio under a factor risk model."""
+    import cvxpy as cp
+    from optimizer import _clean_weights
+    w = cp.Variable(len(model.tickers))
+    _solve(cp.Minimize(model.risk_expression(w)), [w >= -1, w <= 1, cp.sum(w) == 1], "factor_min_volatility")
+    weights = _clean_weights(model.tickers, w.value)
+    return weights, _performance(model, w.value, None, '------performance for factor model min_volatility_optimized_portfolio-----')
+
+
+def maximize_return_given_risk(model, mu, target_volatility, gamma=0.1):
+    """Long-only maximum return for a target volatility, with L2 regularization, under a factor risk model."""
+    import cvxpy as cp
+    from optimizer import _clean_weights
+    w = cp.Variable(len(model.tickers))
+    objective = cp.Maximize(mu.to_numpy() @ w - gamma * cp.sum_squares(w))
+    _solve(objective, [model.risk_expression(w) <= target_volatility ** 2, cp.sum(w) == 1, w >= 0, w <= 1], "factor_efficient_risk")
+    weights = _clean_weights(model.tickers, w.value)
+    return weights, _performance(model, w.value, mu.to_numpy(), "-----Performance for factor model maximised return for a given risk-----")
+
+
+def minimize_risk_given_return(model, mu, target_return, market_neutral=True, gamma=1):
+    """Long/short (weights in [-1, 1]) minimum variance for a target return, with L2 regularization, under a factor risk model."""
+    import cvxpy as cp
+    from optimizer import _clean_weights
+    from problem_cache import _max_return
+    # The same bound on the target as the dense path (see problem_cache.efficient_return)
+    if target_return > _max_return(mu.to_numpy(), -1, 1, 1):
+        raise ValueError("target_return must be lower than the maximum possible return")
+    w = cp.Variable(len(model.tickers))
+    objective = cp.Minimize(model.risk_expression(w) + gamma * cp.sum_squares(w))
+    constraints = [w >= -1, w <= 1, mu.to_numpy() @ w >= target_return, cp.sum(w) == (0 if market_neutral else 1)]
+    _solve(objective, constraints, "factor_efficient_return")
+    weights = _clean_weights(model.tickers, w.value)
+    return weights, _performance(model, w.value, mu.to_numpy(), "------Performance for factor model minimised risk for given return-----")
@@ -0,0 +1,32 @@
+"""
+gunicorn settings: ``gunicorn app:app`` picks this file up from the working directory.
+
+With OPTIMISER_PRELOAD=1 (the default) the app is imported and warmed up once
+in the master, and workers are forked from that warm state. With
+OPTIMISER_PRELOAD=0 each worker imports the app itself, deferring the heavy
+libraries to the first request that needs them.
+"""
+import os
+import warmup
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("OPTIMISER_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    if preload_app:
+        summary = warmup.preload()
+        server.log.info(f"Preloaded {summary['tickers']} stored tickers and warmed solvers in {summary['seconds']:.2f}s")
+    warmup.mark_ready()
+    server.log.info(warmup.report("master"))
+
+
+def post_fork(server, worker):
+    warmup.mark_start()
+
+
+def post_worker_init(worker):
+    warmup.mark_ready()
+    worker.log.info(warmup.report("worker"))
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+
+class RunningCovariance:
+    """
+    Covariance of a stream of daily returns kept as running sufficient statistics.
+
+    Holds, for the observations seen so far, the count, the sums of returns,
+    the cross-products x x', and the third and fourth order cross moments
+    x^2 x' and x^2 (x^2)' that the Ledoit-Wolf shrinkage intensity needs, plus
+    exponentially weighted sums of x and x x'. Adding or removing an
+    observation costs O(N^2); the sample, Ledoit-Wolf and EWMA covariances are
+    produced on demand from the statistics without another pass over history.
+    Missing returns count as zero, as in pypfopt's CovarianceShrinkage.
+    """
+
+    def __init__(self, tickers, span=180, frequency=252):
+        n_tickers = len(tickers)
+        self.tickers = list(tickers)
+        self.frequency = frequency
+        self.decay = 1 - 2 / (span + 1)
+        self.n = 0
+        self.last = None
+        self.s1 = np.zeros(n_tickers)
+        self.s2 = np.zeros((n_tickers, n_tickers))
+        self.s3 = np.zeros((n_tickers, n_tickers))
+        self.s4 = np.zeros((n_tickers, n_tickers))
+        self.ew_weight = 0.0
+        self.ew_s1 = np.zeros(n_tickers)
+        self.ew_s2 = np.zeros((n_tickers, n_tickers))
+
+    @classmethod
+    def from_returns(cls, returns, span=180, frequency=252):
+        """Build the statistics from a returns DataFrame in one batched pass."""
+        stats = cls(returns.columns, span=span, frequency=frequency)
+        stats.update(returns)
+        return stats
+
+    def copy(self):
+        other = RunningCovariance.__new__(RunningCovariance)
+        other.__dict__.update({k: v.copy() if isinstance(v, (np.ndarray, list)) else v for k, v in self.__dict__.items()})
+        return other
+
+    def update(self, returns):
+        """Add observations: a returns DataFrame (or T x N array) whose columns are in ``tickers`` order."""
+        if isinstance(returns, pd.DataFrame):
+            if len(returns):
+                self.last = returns.index[-1]
+            returns = returns.to_numpy()
+        X = np.nan_to_num(np.atleast_2d(np.asarray(returns, dtype=float)))
+        X2 = X ** 2
+        self.n += len(X)
+        self.s1 += X.sum(axis=0)
+        self.s2 += X.T @ X
+        self.s3 += X2.T @ X
+        self.s4 += X2.T @ X2
+        # Decay the exponentially weighted sums by len(X) steps and add the batch, newest weighted 1
+        weights = self.decay ** np.arange(len(X))[::-1]
+        carry = self.decay ** len(X)
+        self.ew_weight = carry * self.ew_weight + weights.sum()
+        self.ew_s1 = carry * self.ew_s1 + weights @ X
+        self.ew_s2 = carry * self.ew_s2 + (X.T * weights) @ X
+
+    def remove(self, returns):
+        """Drop the oldest observations of a rolling window; the EWMA state is left untouched, as it already forgets them."""
+        if isinstance(returns, pd.DataFrame):
+            returns = returns.to_numpy()
+        X = np.nan_to_num(np.atleast_2d(np.asarray(returns, dtype=float)))
+        X2 = X ** 2
+        self.n -= len(X)
+        self.s1 -= X.sum(axis=0)
+        self.s2 -= X.T @ X
+        self.s3 -= X2.T @ X
+        self.s4 -= X2.T @ X2
+
+    def add_ticker(self, ticker, column, panel):
+        """
+        Add a ticker given its returns and the existing tickers' returns over the same observations.
+
+        Only the new row and column of each statistic are computed, in O(T * N).
+        """
+        x = np.nan_to_num(np.asarray(column, dtype=float))
+        P = np.nan_to_num(np.asarray(panel, dtype=float))
+        x2, P2 = x ** 2, P ** 2
+        self.s1 = np.append(self.s1, x.sum())
+        self.s2 = self._grow(self.s2, P.T @ x, P.T @ x, x @ x)
+        self.s3 = self._grow(self.s3, x2 @ P, P2.T @ x, x2 @ x)
+        self.s4 = self._grow(self.s4, P2.T @ x2, P2.T @ x2, x2 @ x2)
+
+        # Assumes the EWMA state was built from exactly these observations
+        weights = self.decay ** np.arange(len(x))[::-1]
+        ew_cross = (weights * x) @ P
+        self.ew_s1 = np.append(self.ew_s1, weights @ x)
+        self.ew_s2 = self._grow(self.ew_s2, ew_cross, ew_cross, weights @ x2)
+        self.tickers.append(ticker)
+
+    def drop_ticker(self, ticker):
+        """Remove a ticker's row and column from every statistic."""
+        i = self.tickers.index(ticker)
+        self.s1 = np.delete(self.s1, i)
+        self.ew_s1 = np.delete(self.ew_s1, i)
+        for name in ("s2", "s3", "s4", "ew_s2"):
+            setattr(self, name, np.delete(np.delete(getattr(self, name), i, axis=0), i, axis=1))
+        del self.tickers[i]
+
+    def subset(self, tickers):
+        """Statistics of ``tickers`` alone, cut out of these in O(K^2) instead of rebuilt from their returns."""
+        position = {ticker: i for i, ticker in enumerate(self.tickers)}
+        idx = np.array([position[ticker] for ticker in tickers], dtype=int)
+        other = RunningCovariance.__new__(RunningCovariance)
+        other.__dict__.update(self.__dict__)
+        other.tickers = list(tickers)
+        other.s1, other.ew_s1 = self.s1[idx], self.ew_s1[idx]
+        for name in ("s2", "s3", "s4", "ew_s2"):
+            setattr(other, name, getattr(self, name)[np.ix_(idx, idx)])
+        return other
+
+    @staticmethod
+    def _grow(matrix, row, column, corner):
+        n = len(matrix)
+        grown = np.empty((n + 1, n + 1))
+        grown[:n, :n] = matrix
+        grown[:n, n] = column
+        grown[n, :n] = row
+        grown[n, n] = corner
+        return grown
+
+    def _frame(self, raw):
+        return pd.DataFrame(raw * self.frequency, index=self.tickers, columns=self.tickers)
+
+    def sample_covariance(self):
+        """Annualized sample covariance."""
+        mean = self.s1 / self.n
+        return self._frame((self.s2 - self.n * np.outer(mean, mean)) / (self.n - 1))
+
+    def ewma_covariance(self):
+        """Annualized exponentially weighted covariance."""
+        mean = self.ew_s1 / self.ew_weight
+        return self._frame(self.ew_s2 / self.ew_weight - np.outer(mean, mean))
+
+    def ledoit_wolf(self):
+        """
+        Annualized Ledoit-Wolf covariance shrunk towards constant variance.
+
+        Matches ``CovarianceShrinkage(prices).ledoit_wolf()`` on the same
+        observations; the sums of the centred data's second and fourth
+        powers are expanded in terms of the raw moments.
+        """
+        from pypfopt.risk_models import fix_nonpositive_semidefinite
+        n, p = self.n, len(self.tickers)
+        m = self.s1 / n
+        m2 = m ** 2
+        q = np.diag(self.s2)
+
+        emp_cov = (self.s2 - n * np.outer(m, m)) / n
+        emp_cov_trace = np.diag(emp_cov)
+        mu = emp_cov_trace.sum() / p
+        # sum_ij sum_t (x_ti - m_i)^2 (x_tj - m_j)^2
+        beta_ = (self.s4.sum() - 4 * (self.s3 @ m).sum() + 2 * q.sum() * m2.sum()
+                 + 4 * m @ self.s2 @ m - 4 * (m @ self.s1) * m2.sum() + n * m2.sum() ** 2)
+        delta_ = (emp_cov ** 2).sum()
+
+        beta = (beta_ / n - delta_) / (p * n)
+        delta = (delta_ - 2 * mu * emp_cov_trace.sum() + p * mu ** 2) / p
+        beta = min(beta, delta)
+        shrinkage = 0 if beta == 0 else beta / delta
+
+        shrunk = (1 - shrinkage) * emp_cov
+        shrunk.flat[::p + 1] += shrinkage * mu
+        return fix_nonpositive_semidefinite(self._frame(shrunk), fix_method="spectral")
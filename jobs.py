@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from optimizer import download_prices
+from strategies import run_strategy
+
+DEFAULT_JOB_DIR = os.environ.get(
+    "JOB_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jobs"),
+)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue already holds its maximum of unfinished jobs."""
+
+
+def run_job(strategy, tickers, params, total_portfolio_value, lookback=None):
+    """Download prices and run one strategy, producing the same payload as its endpoint."""
+    prices, valid_tickers, errors = download_prices(tickers, lookback=lookback)
+    if not valid_tickers:
+        return {"weights": {}, "allocations": {}, "shares": {}, "leftover": 0, "performance": {}, "errors": errors}
+    result = run_strategy(strategy, prices[valid_tickers], params, total_portfolio_value)
+    result["errors"] = errors
+    return result
+
+
+def _write_status(path, status):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    os.replace(tmp_path, path)
+
+
+def _start(directory, job_id, status, fn, *args):
+    """Run a job in its pool worker, first recording it as running, unless it was cancelled while queued."""
+    if os.path.exists(os.path.join(directory, f"{job_id}.cancel")):
+        return None
+    _write_status(os.path.join(directory, f"{job_id}.json"), dict(status, status="running"))
+    return fn(*args)
+
+
+class JobQueue:
+    """
+    Local job queue backed by a process pool.
+
+    At most ``max_pending`` jobs may be queued or running at once; finished
+    jobs are kept for ``ttl`` seconds so clients can poll their result, then
+    expire. Queued jobs can be cancelled outright. A job that is already
+    running cannot be interrupted inside the solver, so cancelling it only
+    discards its result.
+
+    Every job's status is also written to ``directory``, on every change
+    (queued, running, cancelled, finished), so that, behind gunicorn, a poll
+    or cancel landing on another worker than the one that accepted the job
+    still finds it.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, ttl=3600, directory=DEFAULT_JOB_DIR):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.directory = directory
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix="json"):
+        return os.path.join(self.directory, f"{job_id}.{suffix}")
+
+    def _write(self, job_id, status):
+        _write_status(self._path(job_id), status)
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)`` and return the new job's id."""
+        with self._lock:
+            self._expire()
+            unfinished = sum(1 for job in self._jobs.values() if not job["future"].done())
+            if unfinished >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} unfinished jobs)")
+            job_id = uuid.uuid4().hex
+            job = {
+                "submitted": time.time(),
+                "finished": None,
+                "cancelled": False,
+            }
+            status = {"id": job_id, "status": "queued", "submitted": job["submitted"], "finished": None}
+            self._write(job_id, status)
+            job["future"] = self._executor.submit(_start, self.directory, job_id, status, fn, *args)
+            self._jobs[job_id] = job
+        job["future"].add_done_callback(lambda _: self._finish(job_id, job))
+        return job_id
+
+    def _finish(self, job_id, job):
+        job["finished"] = time.time()
+        if os.path.exists(self._path(job_id, "cancel")):
+            job["cancelled"] = True
+        self._write(job_id, self._status(job_id, job))
+
+    def _status(self, job_id, job):
+        future = job["future"]
+        status = {"id": job_id, "submitted": job["submitted"], "finished": job["finished"]}
+        if job["cancelled"] or future.cancelled():
+            status["status"] = "cancelled"
+        elif not future.done():
+            status["status"] = "running" if future.running() else "queued"
+        elif future.exception() is not None:
+            status["status"] = "failed"
+            status["error"] = str(future.exception())
+        else:
+            status["status"] = "done"
+            status["result"] = future.result()
+        return status
+
+    def status(self, job_id):
+        """Return the job's status and, once it has finished, its result or error; None for unknown or expired ids."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._status(job_id, job)
+        # Accepted by another worker
+        return self._read(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; returns False if the id is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job["finished"] is None:
+                    # The marker stops the job if its worker has not started it yet
+                    open(self._path(job_id, "cancel"), "w").close()
+                job["future"].cancel()
+                job["cancelled"] = True
+                self._write(job_id, self._status(job_id, job))
+                return True
+        status = self._read(job_id)
+        if status is None:
+            return False
+        if status["status"] in ("queued", "running"):
+            # Leave a marker for the worker that owns the job
+            open(self._path(job_id, "cancel"), "w").close()
+            status["status"] = "cancelled"
+            self._write(job_id, status)
+        return True
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] is None and os.path.exists(self._path(job_id, "cancel")):
+                job["future"].cancel()
+                job["cancelled"] = True
+            if job["finished"] is not None and now - job["finished"] > self.ttl:
+                del self._jobs[job_id]
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl and name.split(".")[0] not in self._jobs:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_queue = None
+
+
+def get_queue():
+    """Return the process-wide job queue, creating it on first use."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(
+            max_workers=int(os.environ.get("JOB_WORKERS", 2)),
+            max_pending=int(os.environ.get("JOB_QUEUE_SIZE", 32)),
+            ttl=float(os.environ.get("JOB_TTL", 3600)),
+        )
+    return _queue
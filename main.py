@@ -7,38 +7,6 @@ prices = download_prices(tickers)
 
 mu = get_expected_returns(prices)
 
-# Maximize Sharpe ratio with sector constraints
-sector_mapper = {
-    "MSFT": "Tech",
-    "AMZN": "Consumer Discretionary",
-    "KO": "Consumer Staples",
-    "MA": "Financial Services",
-    "COST": "Consumer Staples",
-    "LUV": "Aerospace",
-    "XOM": "Energy",
-    "PFE": "Healthcare",
-    "JPM": "Financial Services",
-    "UNH": "Healthcare",
-    "ACN": "Misc",
-    "DIS": "Media",
-    "GILD": "Healthcare",
-    "F": "Auto",
-    "TSLA": "Auto"
-}
-
-sector_lower = {
-    "Consumer Staples": 0.1, # at least 10% to staples
-    "Tech": 0.05 # at least 5% to tech
-    # For all other sectors, it will be assumed there is no lower bound
-}
-
-sector_upper = {
-    "Tech": 0.2,
-    "Aerospace":0.1,
-    "Energy": 0.1,
-    "Auto":0.15
-}
-
 
 # Optimize for minimum volatility
 print("#####################################################")
@@ -48,7 +16,7 @@ print(alloc)
 print("#####################################################")
 print("")
 print("#####################################################")
-weights_max_sharpe = max_sharpe_with_sector_constraints(prices, sector_mapper, sector_lower, sector_upper)
+weights_max_sharpe = max_sharpe_with_sector_constraints(prices)
 allocation_max_sharpe = perform_discrete_allocation(weights_max_sharpe,prices)
 print(allocation_max_sharpe)
 print("#####################################################")
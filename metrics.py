@@ -0,0 +1,186 @@
+import os
+import time
+import bisect
+import threading
+import contextlib
+
+# Set OPTIMISER_METRICS=0 to turn instrumentation into no-ops
+ENABLED = os.environ.get("OPTIMISER_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ITERATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Registry:
+    """
+    In-process counters, gauges and histograms keyed by metric name and labels.
+
+    Each gunicorn worker keeps its own registry; a Prometheus scrape sees the
+    worker that served it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+            histogram[1][bisect.bisect_left(buckets, value)] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def register_collector(self, collect):
+        """Add a callable returning (name, type, labels, value) samples, read at every scrape."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h[0], list(h[1]), h[2], h[3])) for key, h in self._histograms.items())
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                declare(name, kind)
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+registry = Registry()
+_request = threading.local()
+
+
+class _Stage:
+    __slots__ = ("name", "start", "listener")
+
+    def __init__(self, name, listener=None):
+        self.name = name
+        self.listener = listener
+
+    def __enter__(self):
+        if self.listener is not None:
+            self.listener(self.name, None)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if ENABLED:
+            registry.observe("optimiser_stage_seconds", elapsed, stage=self.name)
+            timings = getattr(_request, "timings", None)
+            if timings is not None:
+                timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        if self.listener is not None and exc[0] is None:
+            self.listener(self.name, elapsed)
+
+
+def stage(name):
+    """
+    Context manager timing one stage of the hot path.
+
+    The duration goes to the ``optimiser_stage_seconds`` histogram and, within
+    a request, to its Server-Timing header, and the thread's listener (see
+    ``listen``) is told when it starts and ends. When metrics are disabled and
+    nothing listens this returns a shared no-op context manager.
+    """
+    listener = getattr(_request, "listener", None)
+    if not ENABLED and listener is None:
+        return _NULL_STAGE
+    return _Stage(name, listener)
+
+
+@contextlib.contextmanager
+def listen(listener):
+    """
+    Call ``listener(stage, seconds)`` for the stages run by this thread
+    meanwhile, with ``seconds`` None when a stage starts.
+
+    An exception raised by the listener propagates out of the stage, which
+    lets a streaming request abandon its work between stages.
+    """
+    previous = getattr(_request, "listener", None)
+    _request.listener = listener
+    try:
+        yield
+    finally:
+        _request.listener = previous
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    if ENABLED:
+        registry.observe(name, value, buckets, **labels)
+
+
+def record_solver(optimizer, problem):
+    """Record the status, iteration count and solve time of a solved cvxpy problem."""
+    if not ENABLED or problem is None:
+        return
+    registry.inc("optimiser_solver_status_total", optimizer=optimizer, status=problem.status)
+    stats = problem.solver_stats
+    if stats is not None and stats.num_iters is not None:
+        registry.observe("optimiser_solver_iterations", stats.num_iters, ITERATION_BUCKETS, optimizer=optimizer, solver=stats.solver_name)
+    if stats is not None and stats.solve_time is not None:
+        registry.observe("optimiser_solver_seconds", stats.solve_time, optimizer=optimizer, solver=stats.solver_name)
+
+
+def start_request():
+    """Start collecting stage timings for the current request."""
+    if ENABLED:
+        _request.timings = {}
+        _request.start = time.perf_counter()
+
+
+def finish_request(endpoint, status):
+    """Record the request's latency and return its Server-Timing header value, or None."""
+    timings = getattr(_request, "timings", None)
+    if not ENABLED or timings is None:
+        return None
+    elapsed = time.perf_counter() - _request.start
+    _request.timings = None
+    registry.observe("optimiser_request_seconds", elapsed, endpoint=endpoint)
+    registry.inc("optimiser_requests_total", endpoint=endpoint, status=status)
+    timings["total"] = elapsed
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
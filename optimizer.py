@@ -1,81 +1,137 @@
-import yfinance as yf
+import collections
+import numpy as np
 import pandas as pd
-from pypfopt import risk_models, expected_returns, EfficientFrontier, DiscreteAllocation, objective_functions, EfficientSemivariance, EfficientCVaR, HRPOpt
-from yahoo_fin import stock_info as si
+from price_store import get_store
+from risk_cache import get_returns, get_covariance, get_covariance_factor, get_capm_return, get_factor_model, get_factor_capm_return, get_scenarios
+import factor_model
+import problem_cache
+import hrp
+import sectors
+from allocation import allocate
+from panel import build_panel
+import metrics
  
-def download_prices(tickers, start_date="2000-01-01", end_date="2023-01-01"):
-    prices = pd.DataFrame()
+def download_prices(tickers, start_date="2000-01-01", end_date="2023-01-01", store=None, max_workers=8, lookback=None, dtype=None, on_result=None):
+    """
+    Load adjusted close prices from the local price store, fetching only dates it does not hold yet.
+
+    The prices come back as one aligned panel (see panel.build_panel): a
+    ticker is NaN before its first price instead of back-filled. With
+    ``lookback``, only about that many trading days before ``end_date`` are
+    read from the store and the panel keeps the last ``lookback`` rows.
+    ``dtype`` may be "float32" to halve the panel's memory. ``on_result`` is
+    passed on to PriceStore.load_many to report each ticker as it is loaded.
+    """
+    store = store or get_store()
+    if lookback:
+        # Business days plus slack for holidays, so only the window is read and fetched
+        start_date = max(pd.Timestamp(start_date), pd.Timestamp(end_date) - pd.offsets.BDay(int(lookback * 1.1) + 5))
+    # Missing dates are fetched concurrently; a failed ticker only shows up in errors
+    series, failures = store.load_many(tickers, start_date, end_date, max_workers=max_workers, on_result=on_result)
     errors = {}
-    for ticker in tickers:
-        try:
-            # Download data for each ticker
-            data = yf.download(ticker, start=start_date, end=end_date)
-            if data.empty:
-                raise ValueError(f"No data found for {ticker}")            
-            # Use the adjusted close price
-            prices[ticker] = data['Adj Close']
-        except Exception as e:
-            print(f"Failed to download data for {ticker}: {e}")
-            errors[ticker] = f"Error: {e}"  # Store error message in the dictionary
+    for ticker, e in failures.items():
+        print(f"Failed to download data for {ticker}: {e}")
+        errors[ticker] = f"Error: {e}"  # Store error message in the dictionary
 
-    
-    # Reindex to ensure consistent date range across all tickers
-    all_dates = pd.date_range(start=start_date, end=end_date, freq='B')  # 'B' frequency is for business days
-    prices = prices.reindex(all_dates)
-    
-    # Forward-fill and back-fill any missing data
-    prices = prices.ffill().bfill()
-    valid_prices = prices.dropna(axis=1)
+    with metrics.stage("panel"):
+        # One preallocated array instead of concatenating, reindexing and filling full-size copies
+        panel = build_panel(series, tickers, dtype=dtype).tail(lookback)
+        valid_prices = panel.frame()
+    metrics.observe("optimiser_panel_tickers", valid_prices.shape[1], metrics.SIZE_BUCKETS)
+    metrics.observe("optimiser_panel_rows", len(valid_prices), metrics.SIZE_BUCKETS)
     valid_tickers = valid_prices.columns.tolist()
+    # Lets risk_cache key risk models on the stored data version instead of hashing the panel
+    valid_prices.attrs["data_version"] = store.version(valid_tickers)
 
 
     return valid_prices,valid_tickers, errors
+def _clean_weights(tickers, weights, cutoff=1e-4, rounding=5):
+    """Weights rounded and with tiny ones zeroed, as pypfopt's clean_weights."""
+    clean = weights.copy()
+    clean[np.abs(clean) < cutoff] = 0
+    return collections.OrderedDict(zip(tickers, (float(w) for w in np.round(clean, rounding))))
+
+def _performance(weights, mu, S, title=None):
+    """Expected return, volatility and Sharpe ratio of ``weights``, printed under ``title`` (if any) as the optimizers do."""
+    from pypfopt.base_optimizer import portfolio_performance as performance
+    if title is not None:
+        print(title)
+    portfolio_performance = pd.DataFrame(performance(weights, mu, S, verbose=title is not None, risk_free_rate=0),
+                                     index = ["Expected annual return", "Annual volatility", "Sharpe Ratio"],
+                                     columns = ["MVO"])
+    return portfolio_performance.to_dict()
+
 def get_expected_returns(prices):
     """Compute expected returns using CAPM."""
-    mu = expected_returns.capm_return(prices)
+    mu = get_capm_return(prices)
     return mu
 
-def optimize_min_volatility(prices):
-    """Construct a long/short portfolio to minimize variance."""
-    S = risk_models.CovarianceShrinkage(prices).ledoit_wolf()
-    ef = EfficientFrontier(None, S, weight_bounds=(None, None))
-    ef.min_volatility()
-    weights = ef.clean_weights()
-    print('------performance for min_volatility_optimized_portfolio-----')
-    ef.portfolio_performance(verbose=True)
-    portfolio_performance = pd.DataFrame(ef.portfolio_performance(risk_free_rate=0), 
-                                     index = ["Expected annual return", "Annual volatility", "Sharpe Ratio"],
-                                     columns = ["MVO"])
-    performance_data = portfolio_performance.to_dict()
+def optimize_min_volatility(prices, risk_model="ledoit_wolf", n_factors=10):
+    """
+    Construct a long/short portfolio to minimize variance.
+
+    ``risk_model="factor"`` uses a PCA factor model with ``n_factors`` factors
+    instead of a dense Ledoit-Wolf covariance, for large universes.
+    """
+    if risk_model == "factor":
+        return factor_model.optimize_min_volatility(get_factor_model(prices, n_factors))
+    S = get_covariance(prices)
+    # A compiled problem per universe size (see problem_cache), solving EfficientFrontier.min_volatility
+    w = problem_cache.min_volatility(get_covariance_factor(prices))
+    weights = _clean_weights(S.index, w)
+    performance_data = _performance(w, None, S, '------performance for min_volatility_optimized_portfolio-----')
 
     return  weights, performance_data
 
-def perform_discrete_allocation(weights, prices, total_portfolio_value:1000, short_ratio=0.3):
-    """Perform discrete allocation based on optimized weights."""
-    latest_prices = prices.iloc[-1]
-    da = DiscreteAllocation(weights, latest_prices, total_portfolio_value=total_portfolio_value, short_ratio=short_ratio)
-    alloc, leftover = da.lp_portfolio()
+def discrete_allocation(weights, prices, total_portfolio_value=10000, short_ratio=0.3, method="lp", time_limit=None):
+    """
+    Whole shares for the optimized weights at the latest prices.
+
+    Returns ``(shares, leftover)`` with shares as {ticker: signed share count};
+    see allocation.allocate for the methods.
+    """
+    result = allocate(weights, prices.iloc[-1], total_portfolio_value, method=method, short_ratio=short_ratio, time_limit=time_limit)
+    return result["shares"], result["leftover"]
+
+def format_allocations(shares):
+    """Describe share counts as "buy N shares of X" / "sell N shares of X" strings."""
     allocations = {}
-    for asset, shares in alloc.items():
-        action = "buy" if shares > 0 else "sell"
-        shares = abs(shares)  # Convert negative shares to positive for verbal output
-        if asset in allocations:
-            allocations[asset] = f"{action} {shares} shares of {asset}"
-        else:
-            allocations[asset] = f"{action} {shares} shares of {asset}"
+    for asset, count in shares.items():
+        action = "buy" if count > 0 else "sell"
+        allocations[asset] = f"{action} {abs(count)} shares of {asset}"
+    return allocations
+
+def perform_discrete_allocation(weights, prices, total_portfolio_value:1000, short_ratio=0.3, method="lp"):
+    """Perform discrete allocation based on optimized weights."""
+    shares, leftover = discrete_allocation(weights, prices, total_portfolio_value=total_portfolio_value, short_ratio=short_ratio, method=method)
+    allocations = format_allocations(shares)
 #    print(f"leftover: {leftover}")
     print(allocations)
     return allocations, leftover
 
-def max_sharpe_with_sector_constraints(prices, sector_mapper, sector_lower, sector_upper):
-    """Maximize Sharpe ratio with sector constraints."""
-    mu = expected_returns.capm_return(prices)
-    S = risk_models.CovarianceShrinkage(prices).ledoit_wolf()
+def max_sharpe_with_sector_constraints(prices, sector_mapper=None, sector_lower=None, sector_upper=None):
+    """
+    Maximize Sharpe ratio with sector constraints.
+
+    Sectors come from ``sector_mapper`` if given, else from the sector store,
+    and the bounds default to those of sectors.py (see sectors.constraints).
+    """
+    from pypfopt import EfficientFrontier
+    mu = get_capm_return(prices)
+    S = get_covariance(prices)
     
     ef = EfficientFrontier(mu, S)
+    # All sector bounds as two vector constraints on the cached membership matrices, instead of
+    # add_sector_constraints' per-ticker mask and constraint for every bounded sector
+    A_lower, lower, A_upper, upper = sectors.constraints(list(S.index), sector_mapper, sector_lower, sector_upper)
+    if len(lower):
+        ef.add_constraint(lambda w: A_lower @ w >= lower)
+    if len(upper):
+        ef.add_constraint(lambda w: A_upper @ w <= upper)
 
-
-    ef.max_sharpe()
+    with metrics.stage("solve"):
+        ef.max_sharpe()
+    metrics.record_solver("max_sharpe", ef._opt)
     weights = ef.clean_weights()
     print('-----performance for Maximum Sharperatio optimised portfolios-----')
     print("")
@@ -86,51 +142,108 @@ def max_sharpe_with_sector_constraints(prices, sector_mapper, sector_lower, sect
     performance_data = portfolio_performance.to_dict()
     return weights, performance_data
 
-def maximize_return_given_risk(prices, target_volatility):
-    """Maximize return for a given risk, with L2 regularization."""
-    mu = expected_returns.capm_return(prices)
-    S = risk_models.CovarianceShrinkage(prices).ledoit_wolf()
+def maximize_return_given_risk(prices, target_volatility, risk_model="ledoit_wolf", n_factors=10):
+    """Maximize return for a given risk, with L2 regularization (see optimize_min_volatility for ``risk_model``)."""
+    if risk_model == "factor":
+        return factor_model.maximize_return_given_risk(get_factor_model(prices, n_factors), get_factor_capm_return(prices), target_volatility)
+    mu = get_capm_return(prices)
+    S = get_covariance(prices)
     
-    ef = EfficientFrontier(mu, S)
-    ef.add_objective(objective_functions.L2_reg, gamma=0.1)  # gamma is the tuning parameter
-    ef.efficient_risk(target_volatility)
-    weights = ef.clean_weights()
-    print("-----Performance for Maximised return for a given risk Optimised Portfolio-----")
-
-    ef.portfolio_performance(verbose=True)
-    portfolio_performance = pd.DataFrame(ef.portfolio_performance(risk_free_rate=0), 
-                                     index = ["Expected annual return", "Annual volatility", "Sharpe Ratio"],
-                                     columns = ["MVO"])
-    performance_data = portfolio_performance.to_dict()
+    # EfficientFrontier.efficient_risk with an L2_reg objective, gamma=0.1 (gamma is the tuning parameter)
+    w = problem_cache.efficient_risk(get_covariance_factor(prices), S, mu.to_numpy(), target_volatility, gamma=0.1)
+    weights = _clean_weights(S.index, w)
+    performance_data = _performance(w, mu, S, "-----Performance for Maximised return for a given risk Optimised Portfolio-----")
     return weights, performance_data
 
-def minimize_risk_given_return(prices, target_return, market_neutral=True):
-    """Minimize risk for a given return, market-neutral."""
-    mu = expected_returns.capm_return(prices)
-    S = risk_models.CovarianceShrinkage(prices).ledoit_wolf()
+def minimize_risk_given_return(prices, target_return, market_neutral=True, risk_model="ledoit_wolf", n_factors=10):
+    """Minimize risk for a given return, market-neutral (see optimize_min_volatility for ``risk_model``)."""
+    if risk_model == "factor":
+        return factor_model.minimize_risk_given_return(get_factor_model(prices, n_factors), get_factor_capm_return(prices), target_return, market_neutral)
+    mu = get_capm_return(prices)
+    S = get_covariance(prices)
     
-    ef = EfficientFrontier(mu, S, weight_bounds=(None, None))
-    ef.add_objective(objective_functions.L2_reg)
-    ef.efficient_return(target_return=target_return, market_neutral=market_neutral)
-    weights = ef.clean_weights()
-    print('------Performance for minimised risk for given return optimised Portfolio-----')
-    ef.portfolio_performance(verbose=True)
-    portfolio_performance = pd.DataFrame(ef.portfolio_performance(risk_free_rate=0), 
-                                     index = ["Expected annual return", "Annual volatility", "Sharpe Ratio"],
-                                     columns = ["MVO"])
-    performance_data = portfolio_performance.to_dict()
+    # EfficientFrontier.efficient_return with weights in [-1, 1] and an L2_reg objective, gamma=1
+    w = problem_cache.efficient_return(get_covariance_factor(prices), mu.to_numpy(), target_return, market_neutral=market_neutral, gamma=1)
+    weights = _clean_weights(S.index, w)
+    performance_data = _performance(w, mu, S, '------Performance for minimised risk for given return optimised Portfolio-----')
     return weights, performance_data
 
-def efficient_semivariance(prices, mu, benchmark=0, target_return=None):
-    """Efficient semi-variance optimization."""
-    semicov = risk_models.semicovariance(prices, benchmark=benchmark)
-    returns = expected_returns.returns_from_prices(prices).dropna()
+def efficient_frontier_sweep(prices, targets=None, target="volatility", num_points=20):
+    """
+    Trace several points of the efficient frontier with a single problem setup.
+
+    ``target="volatility"`` maximizes return for each target volatility like
+    maximize_return_given_risk; ``target="return"`` minimizes risk for each
+    target return like minimize_risk_given_return. The target is a cvxpy
+    parameter of one EfficientFrontier, so every point after the first only
+    updates it and re-solves from the previous solution. Without explicit
+    ``targets``, ``num_points`` targets span the attainable range.
+
+    Returns a dict of compact arrays: tickers, targets, weights (K x N) and
+    performance (K x 3: return, volatility, Sharpe ratio). Points that are
+    infeasible are left as NaN.
+    """
+    from pypfopt import EfficientFrontier, objective_functions
+    from pypfopt.exceptions import OptimizationError
+    mu = get_capm_return(prices)
+    S = get_covariance(prices)
+
+    if target == "volatility":
+        ef = EfficientFrontier(mu, S)
+        ef.add_objective(objective_functions.L2_reg, gamma=0.1)
+        solve = ef.efficient_risk
+        if targets is None:
+            min_volatility = np.sqrt(1 / np.sum(np.linalg.pinv(S)))
+            targets = np.linspace(min_volatility * 1.001, np.sqrt(np.diag(S)).max(), num_points)
+    elif target == "return":
+        ef = EfficientFrontier(mu, S, weight_bounds=(None, None))
+        ef.add_objective(objective_functions.L2_reg)
+        solve = lambda target_return: ef.efficient_return(target_return=target_return, market_neutral=True)
+        if targets is None:
+            targets = np.linspace(max(mu.min(), 0), mu.max(), num_points)
+    else:
+        raise ValueError(f"Unknown frontier target: {target}")
+
+    targets = np.asarray(targets, dtype=float)
+    weights = np.full((len(targets), len(mu)), np.nan)
+    performance = np.full((len(targets), 3), np.nan)
+    for i, value in enumerate(targets):
+        try:
+            with metrics.stage("solve"):
+                solve(float(value))
+            metrics.record_solver(f"frontier_{target}", ef._opt)
+        except (ValueError, OptimizationError) as e:
+            print(f"No frontier point for {target} {value}: {e}")
+            continue
+        weights[i] = ef.weights
+        performance[i] = ef.portfolio_performance(risk_free_rate=0)
+    print(f'-----Traced {np.isfinite(performance[:, 0]).sum()} of {len(targets)} efficient frontier points-----')
+
+    return {
+        "tickers": list(mu.index),
+        "targets": targets,
+        "weights": weights,
+        "performance": performance,
+    }
+
+def efficient_semivariance(prices, mu, benchmark=0, target_return=None, max_scenarios=None, scenario_method="cluster"):
+    """
+    Efficient semi-variance optimization.
+
+    With ``max_scenarios``, the returns history is first reduced to at most
+    that many scenarios (see scenarios.reduce_scenarios); the reduction report
+    is returned under performance_data["scenarios"].
+    """
+    from pypfopt import EfficientSemivariance
+    returns, scenario_report = get_scenarios(prices, max_scenarios, scenario_method)
     
     es = EfficientSemivariance(mu, returns)
-    if target_return:
-        es.efficient_return(target_return)
-    else:
-        es.min_semivariance()
+    with metrics.stage("solve"):
+        if target_return:
+            es.efficient_return(target_return)
+        else:
+            es.min_semivariance()
+    metrics.record_solver("semivariance", es._opt)
     weights = es.clean_weights()
     print('-----performance for efficient semivarience optimised portfolios------')
     es.portfolio_performance(verbose=True)
@@ -138,21 +251,25 @@ def efficient_semivariance(prices, mu, benchmark=0, target_return=None):
                                      index = ["Expected annual return", "Annual semi-deviation", "Sortino Ratio"],
                                      columns = ["MVO"])
     performance_data = portfolio_performance.to_dict()
+    performance_data["scenarios"] = scenario_report
     return weights,performance_data
 
-def efficient_cvar(prices, mu, target_cvar):
-    """Efficient CVaR optimization."""
-    returns = expected_returns.returns_from_prices(prices).dropna()
+def efficient_cvar(prices, mu, target_cvar, max_scenarios=None, scenario_method="cluster"):
+    """Efficient CVaR optimization, on at most ``max_scenarios`` reduced scenarios if given (see efficient_semivariance)."""
+    returns, scenario_report = get_scenarios(prices, max_scenarios, scenario_method)
     
-    ec = EfficientCVaR(mu, returns)
-    ec.efficient_risk(target_cvar=target_cvar)
-    weights = ec.clean_weights()
+    # EfficientCVaR.efficient_risk on a problem compiled per universe size and scenario count
+    w, cvar = problem_cache.cvar_efficient_risk(returns.to_numpy(), np.asarray(mu, dtype=float), target_cvar)
+    weights = _clean_weights(returns.columns, w)
+    expected_return = float(np.asarray(mu, dtype=float) @ w)
     print('------performance for Efficient CVaR optimization-------')
-    ec.portfolio_performance(verbose=True)
-    portfolio_performance = pd.DataFrame(ec.portfolio_performance(), 
+    print("Expected annual return: {:.1f}%".format(100 * expected_return))
+    print("Conditional Value at Risk: {:.2f}%".format(100 * cvar))
+    portfolio_performance = pd.DataFrame([expected_return, cvar], 
                                      index = ["Expected annual return", "Conditional Value at Risk"],
                                      columns = ["MVO"])
     performance_data = portfolio_performance.to_dict()
+    performance_data["scenarios"] = scenario_report
     return weights, performance_data
 
 def optimize_hrp(prices):
@@ -166,16 +283,13 @@ def optimize_hrp(prices):
         weights (dict): Dictionary containing the optimized weights for assets.
     """
     # Compute expected returns
-    rets = expected_returns.returns_from_prices(prices)
+    rets = get_returns(prices)
     
-    # Optimize using HRP
-    hrp = HRPOpt(rets)
-    hrp.optimize()
-    weights = hrp.clean_weights()
-    portfolio_performance = pd.DataFrame(hrp.portfolio_performance(risk_free_rate=0), 
-                                     index = ["Expected annual return", "Annual volatility", "Sharpe Ratio"],
-                                     columns = ["MVO"])
-    performance_data = portfolio_performance.to_dict()
+    # Same portfolio as pypfopt's HRPOpt, vectorized for large universes (see hrp.py)
+    w, cov, report = hrp.optimize(rets)
+    weights = _clean_weights(rets.columns, w.to_numpy())
+    performance_data = _performance(w.to_numpy(), rets.mean() * 252, cov * 252)
+    performance_data["hrp"] = report
     
     return weights, performance_data
 
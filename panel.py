@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pandas as pd
+
+DEFAULT_DTYPE = os.environ.get("PANEL_DTYPE", "float64")
+
+
+class PricePanel:
+    """
+    Aligned prices of several tickers in one contiguous T x N array.
+
+    Rows are the union of the tickers' trading dates. Each ticker's column is
+    NaN before its first price (``start`` holds that row per ticker) and
+    forward-filled after it, so young tickers are never back-filled with
+    prices from before they listed.
+    """
+
+    def __init__(self, index, tickers, values, start):
+        self.index = index
+        self.tickers = list(tickers)
+        self.values = values
+        self.start = start
+
+    def frame(self):
+        """DataFrame over the panel's array, without copying it."""
+        return pd.DataFrame(self.values, index=self.index, columns=self.tickers, copy=False)
+
+    def tail(self, rows):
+        """The last ``rows`` rows, as a view."""
+        if rows is None or rows >= len(self.index):
+            return self
+        offset = len(self.index) - rows
+        return PricePanel(self.index[offset:], self.tickers, self.values[offset:], np.maximum(self.start - offset, 0))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+
+def _stamps(index, unit):
+    # as_unit copies even when the unit already matches
+    return index.asi8 if index.unit == unit else index.as_unit(unit).asi8
+
+
+def build_panel(series, tickers=None, dtype=None):
+    """
+    Build a PricePanel from a dict of price series keyed by ticker.
+
+    Allocates the T x N array once and fills it column by column, so no
+    intermediate full-size frames are created. Tickers missing from
+    ``series`` or without a single price are left out.
+    """
+    tickers = [t for t in dict.fromkeys(tickers or series) if t in series and series[t].notna().any()]
+    if not tickers:
+        return PricePanel(pd.DatetimeIndex([]), [], np.empty((0, 0), dtype=dtype or DEFAULT_DTYPE), np.empty(0, dtype=int))
+    # Work on int64 timestamps, viewed rather than converted when every index has the same unit
+    units = {series[t].index.unit for t in tickers}
+    unit = units.pop() if len(units) == 1 else "ns"
+    stamps = [_stamps(series[t].index, unit) for t in tickers]
+    # Series from the store usually share one calendar, which skips the union
+    first = stamps[0]
+    if all(len(x) == len(first) and np.array_equal(x, first) for x in stamps[1:]):
+        dates = first
+    else:
+        dates = np.unique(np.concatenate(stamps))
+    index = pd.DatetimeIndex(dates.view(f"datetime64[{unit}]"))
+
+    values = np.full((len(index), len(tickers)), np.nan, dtype=dtype or DEFAULT_DTYPE)
+    start = np.empty(len(tickers), dtype=int)
+    rows = np.arange(len(index))
+    for j, ticker in enumerate(tickers):
+        column = values[:, j]
+        column[np.searchsorted(dates, stamps[j])] = series[ticker].to_numpy(dtype=float)
+        # Forward-fill gaps after the first price; leave the rows before it NaN
+        observed = ~np.isnan(column)
+        start[j] = observed.argmax()
+        if not observed[start[j]:].all():
+            last_observed = np.maximum.accumulate(np.where(observed, rows, 0))
+            column[start[j]:] = column[last_observed[start[j]:]]
+    return PricePanel(index, tickers, values, start)
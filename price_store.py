@@ -0,0 +1,296 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import metrics
+
+DEFAULT_STORE_DIR = os.environ.get(
+    "PRICE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".price_store"),
+)
+
+
+class YahooProvider:
+    """Fetch adjusted close prices from Yahoo Finance."""
+
+    def fetch(self, ticker, start_date, end_date):
+        import yfinance as yf
+        data = yf.download(ticker, start=start_date, end=end_date, auto_adjust=False, progress=False)
+        if data.empty:
+            return _empty(ticker)
+        close = data['Adj Close']
+        # Newer yfinance versions return a (field, ticker) column index even for one ticker
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        return close.rename(ticker)
+
+    def fetch_many(self, tickers, start_date, end_date):
+        """Fetch several tickers in one batched Yahoo call."""
+        import yfinance as yf
+        data = yf.download(list(tickers), start=start_date, end=end_date, auto_adjust=False,
+                           group_by="ticker", threads=True, progress=False)
+        if data.empty:
+            # No trading days in the range, or the whole call failed: PriceStore._append keeps empty results uncovered
+            return {ticker: _empty(ticker) for ticker in tickers}
+        result = {}
+        for ticker in tickers:
+            close = None
+            if ticker in data.columns.get_level_values(0):
+                close = data[ticker]['Adj Close'].dropna().rename(ticker)
+            # Missing or all-NaN while others have prices means this ticker failed: report it so it is retried
+            result[ticker] = close if close is not None and not close.empty else ValueError(f"No data found for {ticker}")
+        return result
+
+
+class CSVProvider:
+    """
+    Local file-backed provider, a drop-in stand-in for YahooProvider.
+
+    Expects one ``<TICKER>.csv`` per ticker in ``directory`` with a ``Date``
+    column and an ``Adj Close`` column.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start_date, end_date):
+        path = os.path.join(self.directory, f"{ticker}.csv")
+        if not os.path.exists(path):
+            return _empty(ticker)
+        data = pd.read_csv(path, index_col="Date", parse_dates=True)
+        close = data['Adj Close']
+        close = close[(close.index >= pd.Timestamp(start_date)) & (close.index < pd.Timestamp(end_date))]
+        return close.rename(ticker)
+
+
+class PriceStore:
+    """
+    Per-ticker Parquet store of daily prices.
+
+    Each ticker keeps a Parquet file with its price history and a small JSON
+    sidecar recording the date range already requested from the provider, so
+    that a later request only fetches the part of its window that is missing
+    (e.g. the days since the last refresh) and appends it.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, provider=None):
+        self.root = root
+        self.provider = provider or YahooProvider()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._preloaded = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, ticker):
+        name = ticker.replace(os.sep, "_")
+        return os.path.join(self.root, f"{name}.parquet"), os.path.join(self.root, f"{name}.json")
+
+    def _lock(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _read(self, ticker):
+        data_path, meta_path = self._paths(ticker)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if not meta.get("rows"):
+            # An empty history records no coverage (see _append); refetch it
+            return None, None
+        # A preloaded series is only used while its sidecar is unchanged
+        preloaded = self._preloaded.get(ticker)
+        if preloaded is not None and preloaded[1] == meta:
+            return preloaded
+        series = pd.read_parquet(data_path)[ticker]
+        return series, meta
+
+    def stored_tickers(self):
+        return sorted(name[:-len(".json")] for name in os.listdir(self.root) if name.endswith(".json"))
+
+    def preload(self, tickers=None, max_workers=8):
+        """
+        Read the stored series of ``tickers`` (default: all) into memory.
+
+        Called in the gunicorn master before forking, so workers share the
+        series copy-on-write instead of each reading the Parquet files. Returns
+        the number of tickers loaded.
+        """
+        tickers = self.stored_tickers() if tickers is None else list(tickers)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            stored = dict(zip(tickers, pool.map(self._read, tickers)))
+        self._preloaded.update({t: entry for t, entry in stored.items() if entry[0] is not None})
+        return len(self._preloaded)
+
+    def _write(self, ticker, series, meta):
+        data_path, meta_path = self._paths(ticker)
+        # Write to temporary files and rename so readers in other workers never see partial files
+        # Temporary names are unique per writer since several workers may refresh the same ticker
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        series.to_frame(ticker).to_parquet(data_path + suffix)
+        os.replace(data_path + suffix, data_path)
+        with open(meta_path + suffix, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+
+    @staticmethod
+    def _missing(meta, start, end):
+        if meta is None:
+            return [(start, end)]
+        missing = []
+        stored_start, stored_end = pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"])
+        if start < stored_start:
+            missing.append((start, stored_start))
+        if end > stored_end:
+            missing.append((stored_end, end))
+        return missing
+
+    def version(self, tickers):
+        """Return a short fingerprint of the stored data for ``tickers`` that changes whenever any of them is appended to."""
+        state = []
+        for ticker in sorted(set(tickers)):
+            _, meta_path = self._paths(ticker)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+            state.append([ticker, meta])
+        return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()[:16]
+
+    def load(self, ticker, start_date, end_date):
+        """Return the stored prices of ``ticker`` in [start_date, end_date), fetching only missing dates."""
+        prices, errors = self.load_many([ticker], start_date, end_date, max_workers=1)
+        if ticker in errors:
+            raise errors[ticker]
+        return prices[ticker]
+
+    def load_many(self, tickers, start_date, end_date, max_workers=8, on_result=None):
+        """
+        Load several tickers, fetching the dates the store is missing concurrently.
+
+        Tickers missing the same date range are fetched together, with one
+        batched provider call when the provider supports ``fetch_many`` and
+        a bounded thread pool otherwise. A failure only affects its own
+        ticker: returns ``(prices, errors)``, two dicts keyed by ticker.
+
+        ``on_result(ticker, prices, error)`` is called as each ticker is done,
+        stored ones first, then each fetched group as it arrives; an exception
+        it raises stops the remaining fetches.
+        """
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        tickers = list(dict.fromkeys(tickers))
+        with metrics.stage("store_read"), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            stored = dict(zip(tickers, pool.map(self._read, tickers)))
+
+        # Group tickers by the ranges they miss so each group costs one round-trip per range
+        groups = {}
+        for ticker, (_, meta) in stored.items():
+            missing = tuple(self._missing(meta, start, end))
+            if missing:
+                groups.setdefault(missing, []).append(ticker)
+
+        prices, errors = {}, {}
+
+        def done(ticker, series, error=None):
+            if error is None:
+                window = series[(series.index >= start) & (series.index < end)]
+                if window.empty:
+                    error = ValueError(f"No data found for {ticker}")
+                else:
+                    prices[ticker] = window
+            if error is not None:
+                errors[ticker] = error
+            if on_result is not None:
+                on_result(ticker, prices.get(ticker), error)
+
+        fetching = {ticker for group in groups.values() for ticker in group}
+        for ticker in tickers:
+            if ticker not in fetching:
+                done(ticker, stored[ticker][0])
+
+        for missing, group in groups.items():
+            fetched, failed = {}, {}
+            for fetch_start, fetch_end in missing:
+                with metrics.stage("fetch"):
+                    results = self._fetch_group(group, fetch_start.strftime("%Y-%m-%d"), fetch_end.strftime("%Y-%m-%d"), max_workers)
+                metrics.inc("optimiser_fetched_tickers_total", len(group))
+                for ticker, result in results.items():
+                    if isinstance(result, Exception):
+                        failed[ticker] = result
+                    else:
+                        fetched.setdefault(ticker, []).append(result)
+            for ticker in group:
+                if ticker in failed:
+                    done(ticker, None, failed[ticker])
+                else:
+                    done(ticker, self._append(ticker, fetched.get(ticker, []), start, end))
+
+        return {t: prices[t] for t in tickers if t in prices}, errors
+
+    def _fetch_group(self, tickers, start_date, end_date, max_workers):
+        if len(tickers) > 1 and hasattr(self.provider, "fetch_many"):
+            try:
+                return self.provider.fetch_many(tickers, start_date, end_date)
+            except Exception as e:
+                print(f"Batched download failed, falling back to per-ticker downloads: {e}")
+
+        def fetch_one(ticker):
+            try:
+                return self.provider.fetch(ticker, start_date, end_date)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(zip(tickers, pool.map(fetch_one, tickers)))
+
+    def _append(self, ticker, fetched, start, end):
+        with self._lock(ticker):
+            # Re-read under the lock so concurrent appends from other threads are kept
+            series, meta = self._read(ticker)
+            parts = [series] if series is not None else []
+            parts = [p for p in parts + [f.astype(float) for f in fetched] if not p.empty]
+            series = pd.concat(parts) if parts else _empty(ticker)
+            series = series[~series.index.duplicated(keep="last")].sort_index().rename(ticker)
+            series.index.name = "Date"
+            if series.empty:
+                # Yahoo answers errors and rate limits with an empty frame: leave the range
+                # uncovered so the next request fetches it again instead of reporting no data forever
+                return series
+
+            # Never mark today as covered: its close may not be final yet
+            covered_start, covered_end = start, min(end, pd.Timestamp.today().normalize())
+            if meta is not None:
+                covered_start = min(covered_start, pd.Timestamp(meta["start"]))
+                covered_end = max(covered_end, pd.Timestamp(meta["end"]))
+            meta = {
+                "start": covered_start.strftime("%Y-%m-%d"),
+                "end": covered_end.strftime("%Y-%m-%d"),
+                "rows": int(len(series)),
+            }
+            self._write(ticker, series, meta)
+            self._preloaded.pop(ticker, None)
+        return series
+
+
+def _empty(ticker):
+    return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="Date"), name=ticker)
+
+
+_store = None
+
+
+def get_store():
+    """Return the process-wide price store, creating it on first use."""
+    global _store
+    if _store is None:
+        _store = PriceStore()
+    return _store
+
+
+def set_store(store):
+    """Replace the process-wide price store, e.g. with one backed by CSVProvider in tests."""
+    global _store
+    _store = store
@@ -0,0 +1,170 @@
+"""
+Compiled optimization problems reused across requests.
+
+pypfopt builds and canonicalizes a new cvxpy problem for every call, which
+for small universes takes longer than the solve. Here each problem is written
+once per shape (strategy, number of assets, scenarios, weight-sum
+constraint) with the covariance (as its Cholesky factor), expected returns,
+scenarios and targets as cvxpy Parameters, so it is DPP and cvxpy compiles
+it on its first solve only. Later requests of the same shape set the
+parameter values and re-solve, warm-started where the solver supports it.
+
+The formulations are those of the EfficientFrontier and EfficientCVaR
+methods the optimizers used, so the weights agree with pypfopt's to solver
+tolerance.
+"""
+import os
+import threading
+import numpy as np
+from risk_cache import RiskModelCache
+import metrics
+
+_problems = RiskModelCache(maxsize=int(os.environ.get("PROBLEM_CACHE_SIZE", 16)))
+
+metrics.registry.register_collector(lambda: [
+    ("optimiser_problem_cache_hits_total", "counter", {}, _problems.hits),
+    ("optimiser_problem_cache_misses_total", "counter", {}, _problems.misses),
+])
+
+
+def cholesky_factor(S):
+    """Lower-triangular L with L L' = S; a symmetric square root when S is only semidefinite."""
+    S = np.asarray(S, dtype=float)
+    try:
+        return np.linalg.cholesky(S)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(S)
+        return vectors * np.sqrt(np.clip(values, 0, None))
+
+
+class CompiledProblem:
+    """A cvxpy problem with its weight variable and named parameters; ``lock`` serializes its solves."""
+
+    def __init__(self, problem, w, parameters, extra=None):
+        self.problem = problem
+        self.w = w
+        self.parameters = parameters
+        self.extra = extra or {}
+        self.lock = threading.Lock()
+
+    def solve(self, name, **values):
+        """Set the parameters, re-solve and return the raw weights; raises OptimizationError unless optimal."""
+        from pypfopt.exceptions import OptimizationError
+        for key, value in values.items():
+            self.parameters[key].value = value
+        with metrics.stage("solve"):
+            self.problem.solve(warm_start=True)
+        metrics.record_solver(name, self.problem)
+        if self.problem.status not in {"optimal", "optimal_inaccurate"}:
+            raise OptimizationError(f"Solver status: {self.problem.status}")
+        # As pypfopt: drop float noise and signed zeros
+        return self.w.value.round(16) + 0.0
+
+
+def _bounds(w, lower, upper):
+    return [w >= lower, w <= upper]
+
+
+def _min_volatility(n):
+    import cvxpy as cp
+    w = cp.Variable(n)
+    L = cp.Parameter((n, n))
+    problem = cp.Problem(cp.Minimize(cp.sum_squares(L.T @ w)), _bounds(w, -1, 1) + [cp.sum(w) == 1])
+    return CompiledProblem(problem, w, {"L": L})
+
+
+def _efficient_risk(n, gamma):
+    import cvxpy as cp
+    w = cp.Variable(n)
+    L, mu = cp.Parameter((n, n)), cp.Parameter(n)
+    target_variance = cp.Parameter(nonneg=True)
+    objective = cp.Minimize(-(mu @ w) + gamma * cp.sum_squares(w))
+    constraints = _bounds(w, 0, 1) + [cp.sum_squares(L.T @ w) <= target_variance, cp.sum(w) == 1]
+    return CompiledProblem(cp.Problem(objective, constraints), w, {"L": L, "mu": mu, "target_variance": target_variance})
+
+
+def _efficient_return(n, gamma, market_neutral):
+    import cvxpy as cp
+    w = cp.Variable(n)
+    L, mu = cp.Parameter((n, n)), cp.Parameter(n)
+    target_return = cp.Parameter()
+    objective = cp.Minimize(cp.sum_squares(L.T @ w) + gamma * cp.sum_squares(w))
+    constraints = _bounds(w, -1, 1) + [mu @ w >= target_return, cp.sum(w) == (0 if market_neutral else 1)]
+    return CompiledProblem(cp.Problem(objective, constraints), w, {"L": L, "mu": mu, "target_return": target_return})
+
+
+def _cvar_efficient_risk(n, n_scenarios, beta):
+    import cvxpy as cp
+    w, alpha, u = cp.Variable(n), cp.Variable(), cp.Variable(n_scenarios)
+    mu, returns = cp.Parameter(n), cp.Parameter((n_scenarios, n))
+    target_cvar = cp.Parameter(nonneg=True)
+    cvar = alpha + 1.0 / (n_scenarios * (1 - beta)) * cp.sum(u)
+    constraints = _bounds(w, 0, 1) + [cvar <= target_cvar, u >= 0.0, returns @ w + alpha + u >= 0.0, cp.sum(w) == 1]
+    problem = cp.Problem(cp.Minimize(-(mu @ w)), constraints)
+    return CompiledProblem(problem, w, {"mu": mu, "returns": returns, "target_cvar": target_cvar}, {"cvar": cvar})
+
+
+def get_problem(kind, *shape):
+    """The compiled problem of ``kind`` for ``shape``, built on first use in this process."""
+    builders = {
+        "min_volatility": _min_volatility,
+        "efficient_risk": _efficient_risk,
+        "efficient_return": _efficient_return,
+        "cvar_efficient_risk": _cvar_efficient_risk,
+    }
+    return _problems.get((kind,) + shape, lambda: builders[kind](*shape))
+
+
+def _max_return(mu, lower, upper, total):
+    """Largest mu @ w with ``lower <= w <= upper`` and sum(w) == total: fill the best assets first."""
+    order = np.argsort(-mu)
+    w = np.full(len(mu), float(lower))
+    room = total - w.sum()
+    for i in order:
+        step = min(upper - lower, room)
+        if step <= 0:
+            break
+        w[i] += step
+        room -= step
+    return float(mu @ w)
+
+
+def min_volatility(L):
+    """Long/short (weights in [-1, 1]) minimum variance weights, as EfficientFrontier.min_volatility."""
+    compiled = get_problem("min_volatility", len(L))
+    with compiled.lock:
+        return compiled.solve("min_volatility", L=L)
+
+
+def efficient_risk(L, S, mu, target_volatility, gamma=0.1):
+    """Long-only maximum return for a target volatility with L2 regularization, as EfficientFrontier.efficient_risk."""
+    if not isinstance(target_volatility, (float, int)) or target_volatility < 0:
+        raise ValueError("target_volatility should be a positive float")
+    global_min_volatility = np.sqrt(1 / np.sum(np.linalg.pinv(S)))
+    if target_volatility < global_min_volatility:
+        raise ValueError(f"The minimum volatility is {global_min_volatility:.3f}. Please use a higher target_volatility")
+    compiled = get_problem("efficient_risk", len(mu), gamma)
+    with compiled.lock:
+        return compiled.solve("efficient_risk", L=L, mu=mu, target_variance=target_volatility ** 2)
+
+
+def efficient_return(L, mu, target_return, market_neutral=True, gamma=1):
+    """Long/short minimum variance for a target return with L2 regularization, as EfficientFrontier.efficient_return."""
+    if not isinstance(target_return, float):
+        raise ValueError("target_return should be a float")
+    # pypfopt bounds the target by the maximum return of a fully invested portfolio
+    if target_return > _max_return(mu, -1, 1, 1):
+        raise ValueError("target_return must be lower than the maximum possible return")
+    compiled = get_problem("efficient_return", len(mu), gamma, market_neutral)
+    with compiled.lock:
+        return compiled.solve("efficient_return", L=L, mu=mu, target_return=target_return)
+
+
+def cvar_efficient_risk(returns, mu, target_cvar, beta=0.95):
+    """Long-only maximum return for a target CVaR, as EfficientCVaR.efficient_risk; returns the weights and their CVaR."""
+    if target_cvar is None or target_cvar < 0:
+        raise ValueError("target_cvar should be a positive float")
+    compiled = get_problem("cvar_efficient_risk", returns.shape[1], returns.shape[0], beta)
+    with compiled.lock:
+        weights = compiled.solve("cvar", mu=mu, returns=returns, target_cvar=target_cvar)
+        return weights, float(compiled.extra["cvar"].value)
@@ -10,6 +10,7 @@ payload = {
 }
 
 response = requests.post(url, json=payload)
+response.raise_for_status()
 data = response.json()
 
 print("Optimized Weights:", data["weights"])
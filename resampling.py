@@ -0,0 +1,174 @@
+"""
+Resampled (Michaud) portfolios: how much a strategy's weights move with estimation noise.
+
+The returns panel is resampled many times, either by bootstrapping its days
+or by drawing Monte Carlo paths from a normal with its mean and Ledoit-Wolf
+covariance. The strategy's inputs are re-estimated for a whole batch of
+resamples at once and the strategy is re-run on each; the batches run on the
+strategies process pool. Every resample draws from its own child of one
+SeedSequence, so the results depend on the seed only, not on how the
+resamples were batched or how many workers ran them.
+"""
+import os
+import numpy as np
+import pandas as pd
+import risk_cache
+from problem_cache import cholesky_factor
+from strategies import STRATEGIES, WORKERS, get_pool
+import metrics
+
+METHODS = ("bootstrap", "montecarlo")
+MAX_RESAMPLES = int(os.environ.get("MAX_RESAMPLES", 2000))
+# Upper bound on the floats of one batch of resampled panels (T x N each)
+BATCH_FLOATS = int(os.environ.get("RESAMPLE_BATCH_FLOATS", 8 * 1024 * 1024))
+
+
+def draw(returns, seeds, method="bootstrap", moments=None):
+    """
+    Resampled returns panels, K x T x N for K seeds.
+
+    "bootstrap" draws T days with replacement; "montecarlo" draws T normal
+    days with ``moments``, the daily mean and a factor L of the covariance.
+    """
+    X = returns.to_numpy(dtype=float)
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    if method == "bootstrap":
+        return X[np.stack([rng.integers(0, len(X), len(X)) for rng in rngs])]
+    mean, L = moments
+    Z = np.stack([rng.standard_normal(X.shape) for rng in rngs])
+    return Z @ L.T + mean
+
+
+def ledoit_wolf(X, frequency=252):
+    """
+    Annualized Ledoit-Wolf covariances of a K x T x N batch, as RunningCovariance.ledoit_wolf.
+
+    Missing returns count as zero. The shrunk matrix is a convex combination
+    of the sample covariance and a multiple of the identity, so it needs no
+    positive-semidefinite repair.
+    """
+    X = np.nan_to_num(X)
+    n, p = X.shape[1], X.shape[2]
+    centred = X - X.mean(axis=1, keepdims=True)
+    emp_cov = centred.transpose(0, 2, 1) @ centred / n
+    trace = np.trace(emp_cov, axis1=1, axis2=2)
+    mu = trace / p
+    squared = centred ** 2
+    beta_ = (squared.transpose(0, 2, 1) @ squared).sum(axis=(1, 2))
+    delta_ = (emp_cov ** 2).sum(axis=(1, 2))
+    beta = (beta_ / n - delta_) / (p * n)
+    delta = (delta_ - 2 * mu * trace + p * mu ** 2) / p
+    beta = np.minimum(beta, delta)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shrinkage = np.where(beta == 0, 0.0, beta / delta)
+    shrunk = (1 - shrinkage)[:, None, None] * emp_cov
+    shrunk[:, np.arange(p), np.arange(p)] += (shrinkage * mu)[:, None]
+    return shrunk * frequency
+
+
+def capm_return(X, frequency=252):
+    """CAPM expected returns of a K x T x N batch against each panel's equally-weighted market, as factor_model.capm_return."""
+    observed = ~np.isnan(X)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        market = np.nanmean(X, axis=2)
+        counts = observed.sum(axis=1)
+        Xz = np.where(observed, X, 0.0)
+        market_by_ticker = np.where(observed, market[:, :, None], 0.0)
+        mean_x = Xz.sum(axis=1) / counts
+        mean_market = market_by_ticker.sum(axis=1) / counts
+        cov_market = np.where(observed, (Xz - mean_x[:, None]) * (market[:, :, None] - mean_market[:, None]), 0.0).sum(axis=1) / (counts - 1)
+        betas = cov_market / np.nanvar(market, axis=1, ddof=1)[:, None]
+        market_return = np.nanprod(1 + market, axis=1) ** (frequency / np.count_nonzero(~np.isnan(market), axis=1)) - 1
+    return betas * market_return[:, None]
+
+
+def _run_batch(strategy, prices, params, seeds, method, moments):
+    """Weights of ``strategy`` on the resamples of ``seeds``: a K x N array, NaN rows for failures, and their messages."""
+    returns = risk_cache.get_returns(prices)
+    with metrics.stage("resample_draw"):
+        samples = draw(returns, seeds, method, moments)
+    needed = STRATEGIES[strategy][1]
+    with metrics.stage("resample_estimate"):
+        covariances = ledoit_wolf(samples) if "ledoit_wolf" in needed else None
+        mus = capm_return(samples) if "capm_return" in needed else None
+
+    weights = np.full((len(seeds), prices.shape[1]), np.nan)
+    failures = []
+    for k, sample in enumerate(samples):
+        sample_returns = pd.DataFrame(sample, index=returns.index, columns=returns.columns)
+        # A price panel the resampled returns come from, for the strategy to run on
+        sample_prices = sample_returns.fillna(0).add(1).cumprod().mul(prices.iloc[-1]).where(sample_returns.notna())
+        # Not the real panel's data version: its inputs are this resample's own
+        sample_prices.attrs = {}
+        risk_inputs = {"returns": sample_returns}
+        if covariances is not None:
+            risk_inputs["ledoit_wolf"] = pd.DataFrame(covariances[k], index=returns.columns, columns=returns.columns)
+        if mus is not None:
+            risk_inputs["capm_return"] = pd.Series(mus[k], index=returns.columns)
+        # Used once, so kept out of the shared risk cache
+        with risk_cache.isolated():
+            risk_cache.prime(sample_prices, risk_inputs)
+            try:
+                w, _ = STRATEGIES[strategy][0](sample_prices, params)
+            except Exception as e:
+                failures.append(str(e))
+                continue
+        weights[k] = [w.get(ticker, 0.0) for ticker in prices.columns]
+    return weights, failures
+
+
+def _batches(seeds, size):
+    return [seeds[i:i + size] for i in range(0, len(seeds), size)]
+
+
+def resample(prices, strategy, n_resamples=200, method="bootstrap", seed=0, confidence=0.9, params=None, parallel=True):
+    """
+    Resampled weights of a strategy from strategies.STRATEGIES.
+
+    Returns, per ticker (as Series), the average weight over the resamples
+    (Michaud's resampled portfolio), its standard deviation and the central
+    ``confidence`` interval, plus the weights on the original panel, the
+    number of resamples that solved and the messages of those that did not.
+    """
+    params = params or {}
+    if method not in METHODS:
+        raise ValueError(f"method should be one of {', '.join(METHODS)}")
+    if not 0 < n_resamples <= MAX_RESAMPLES:
+        raise ValueError(f"n_resamples should be between 1 and {MAX_RESAMPLES}")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence should be between 0 and 1")
+
+    returns = risk_cache.get_returns(prices)
+    moments = None
+    if method == "montecarlo":
+        moments = (returns.mean().to_numpy(), cholesky_factor(risk_cache.get_covariance(prices).to_numpy() / 252))
+    point, _ = STRATEGIES[strategy][0](prices, params)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_resamples)
+    # A few batches per worker to balance the pool, each small enough to hold in memory
+    size = max(1, min(-(-n_resamples // (4 * WORKERS)), BATCH_FLOATS // max(1, returns.size)))
+    batches = _batches(seeds, size)
+    if not parallel or len(batches) < 2:
+        results = [_run_batch(strategy, prices, params, batch, method, moments) for batch in batches]
+    else:
+        pool = get_pool()
+        futures = [pool.submit(_run_batch, strategy, prices, params, batch, method, moments) for batch in batches]
+        results = [future.result() for future in futures]
+
+    weights = np.concatenate([w for w, _ in results])
+    weights = weights[~np.isnan(weights).any(axis=1)]
+    failures = [message for _, messages in results for message in messages]
+    if not len(weights):
+        raise ValueError(f"None of the {n_resamples} resamples could be optimized: {failures[0]}")
+    tail = (1 - confidence) / 2
+    series = lambda values: pd.Series(values, index=prices.columns)
+    print(f'-----Resampled {strategy} {len(weights)} times ({method})-----')
+    return {
+        "weights": series(weights.mean(axis=0)),
+        "std": series(weights.std(axis=0, ddof=1) if len(weights) > 1 else np.zeros(prices.shape[1])),
+        "lower": series(np.quantile(weights, tail, axis=0)),
+        "upper": series(np.quantile(weights, 1 - tail, axis=0)),
+        "point": series([point.get(ticker, 0.0) for ticker in prices.columns]),
+        "resamples": len(weights),
+        "failures": failures,
+    }
@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+import pandas as pd
+from flask import request, make_response, Response
+from price_store import get_store
+from singleflight import SingleFlight, encode_response, decode_response, shareable_response
+from serialization import FORMATS, negotiate
+import metrics
+
+
+class ResponseCache:
+    """LRU cache of serialized responses, bounded by the total size of their bodies."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        body = entry[1]
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[1])
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_cache = ResponseCache(max_bytes=int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024)))
+
+metrics.registry.register_collector(lambda: [
+    ("optimiser_response_cache_hits_total", "counter", {}, _cache.hits),
+    ("optimiser_response_cache_misses_total", "counter", {}, _cache.misses),
+    ("optimiser_response_cache_bytes", "gauge", {}, _cache.size),
+])
+
+
+_flights = SingleFlight(encode=encode_response, decode=decode_response, shareable=shareable_response)
+
+
+def clear_cache():
+    """Drop every cached response, including the results the single-flight window still serves."""
+    _cache.clear()
+    _flights.clear()
+
+
+def request_key(path, payload, data_version, fmt="json"):
+    """Canonical hash of an endpoint, its JSON payload, the version of the price data it reads and the response format."""
+    canonical = json.dumps([path, payload, data_version, fmt], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _tickers(payload):
+    tickers = payload.get("tickers") if isinstance(payload, dict) else None
+    return tickers if isinstance(tickers, list) else []
+
+
+def _data_version(payload, tickers):
+    """
+    Version of the price data a request reads: the store's version for its
+    tickers, plus, for a request with an end_date, the date it can be covered
+    up to. The store never covers past today, so until a refetch appends a row
+    the version alone would keep serving a later end_date yesterday's panel.
+    """
+    end = payload.get("end_date") if isinstance(payload, dict) else None
+    if end:
+        try:
+            end = min(pd.Timestamp(end), pd.Timestamp.today().normalize()).strftime("%Y-%m-%d")
+        except (ValueError, TypeError):
+            pass
+    return get_store().version(tickers), end
+
+
+def cached_response(view):
+    """
+    Serve repeated identical requests from the response cache.
+
+    Optimization results are deterministic in the request payload and the
+    price data, so a successful response is cached under the payload's
+    canonical hash plus the version of the price data it reads and sent with
+    an ETag. The format negotiated from the Accept header is part of
+    the key. A request whose If-None-Match carries that ETag gets an empty 304.
+    A response sent with Cache-Control: no-store, as one reporting download
+    errors is, is neither cached nor shared: a ticker that failed has no
+    stored data, so its data version would not change once it downloads again.
+
+    On a miss, identical requests running concurrently, in this worker's
+    threads or in other workers, are coalesced under the same key: one runs
+    the view and the others get its response (see singleflight.SingleFlight).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        payload = request.get_json(silent=True)
+        tickers = _tickers(payload)
+        # Each response format is its own entry, and the ETag differs with the body
+        fmt = negotiate(request.headers.get("Accept"), offered=tuple(FORMATS))
+        key = request_key(request.path, payload, _data_version(payload, tickers), fmt)
+        entry = _cache.get(key)
+        if entry is None:
+            def render():
+                response = make_response(view(*args, **kwargs))
+                shared = response.status_code == 200 and not response.cache_control.no_store
+                return response.status_code, response.get_data(), response.mimetype, shared
+
+            status, body, mimetype, shared = _flights.do(key, render)
+            if not shared:
+                response = Response(body, status=status, mimetype=mimetype)
+                if status == 200:
+                    response.cache_control.no_store = True
+                    response.vary.add("Accept")
+                return response
+            entry = (hashlib.sha1(body).hexdigest(), body, mimetype)
+            # The view may have refreshed the store, so key the entry on the data it was computed from
+            _cache.put(request_key(request.path, payload, _data_version(payload, tickers), fmt), entry)
+
+        etag, body, mimetype = entry
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.vary.add("Accept")
+        return response
+    return wrapper
@@ -0,0 +1,183 @@
+import os
+import hashlib
+import threading
+import contextlib
+import numpy as np
+from collections import OrderedDict
+from incremental_risk import RunningCovariance
+import factor_model
+from scenarios import reduce_scenarios
+import metrics
+
+
+class RiskModelCache:
+    """
+    Bounded LRU cache of risk-model inputs (covariance matrices, expected
+    returns, returns frames).
+
+    Entries are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Compute outside the lock so slow estimates do not block other lookups
+        with metrics.stage(key[0]):
+            value = compute()
+        self.put(key, value)
+        return value
+
+    def peek(self, key):
+        """Return the value for ``key`` or None, without counting a hit or miss."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = RiskModelCache(maxsize=int(os.environ.get("RISK_CACHE_SIZE", 32)))
+
+metrics.registry.register_collector(lambda: [
+    ("optimiser_risk_cache_hits_total", "counter", {}, _cache.hits),
+    ("optimiser_risk_cache_misses_total", "counter", {}, _cache.misses),
+])
+
+
+def clear_cache():
+    """Drop every cached risk estimate."""
+    _cache.clear()
+
+
+_local = threading.local()
+
+
+def _current():
+    """The cache this thread reads and fills: a private one inside ``isolated``, else the shared one."""
+    return getattr(_local, "cache", None) or _cache
+
+
+@contextlib.contextmanager
+def isolated():
+    """
+    Keep the risk inputs estimated or primed in this thread in a private cache, dropped on exit.
+
+    For throwaway panels, such as resamples, that would otherwise push the
+    entries of real panels out of the shared cache.
+    """
+    previous = getattr(_local, "cache", None)
+    _local.cache = RiskModelCache(maxsize=_cache.maxsize)
+    try:
+        yield
+    finally:
+        _local.cache = previous
+
+
+def prices_key(prices):
+    """
+    Key a price panel by ticker set, date window and data version.
+
+    download_prices stamps panels with the price store's data version in
+    ``prices.attrs``; panels built elsewhere fall back to a hash of their values.
+    """
+    version = prices.attrs.get("data_version")
+    if version is None:
+        version = hashlib.sha1(prices.to_numpy().tobytes()).hexdigest()[:16]
+    window = (str(prices.index[0]), str(prices.index[-1]), len(prices)) if len(prices) else ()
+    return tuple(prices.columns), window, version
+
+
+def get_returns(prices):
+    """Daily returns of ``prices``, shared across optimizers."""
+    from pypfopt import expected_returns
+    return _current().get(("returns", prices_key(prices)), lambda: expected_returns.returns_from_prices(prices))
+
+
+def get_covariance(prices):
+    """Ledoit-Wolf shrunk covariance of ``prices``, shared across optimizers."""
+    return _current().get(("ledoit_wolf", prices_key(prices)), lambda: get_running_covariance(prices).ledoit_wolf())
+
+
+def get_covariance_factor(prices):
+    """Cholesky factor of the Ledoit-Wolf covariance of ``prices``, the covariance parameter of the compiled problems."""
+    from problem_cache import cholesky_factor
+    return _current().get(("cholesky", prices_key(prices)), lambda: cholesky_factor(get_covariance(prices)))
+
+
+def get_running_covariance(prices):
+    """
+    Running covariance statistics of ``prices``' returns.
+
+    Statistics are kept per ticker universe and start date; when ``prices``
+    extends a panel seen before with newer days, only the new returns are
+    folded in (O(N^2) per day) instead of making another full pass.
+    """
+    returns = get_returns(prices)
+    universe = ("running", tuple(returns.columns), returns.index[0] if len(returns) else None)
+    entry = _current().peek(universe)
+    if entry is not None and _extends(returns, *entry):
+        stats = entry[0]
+        new_returns = returns.iloc[stats.n:]
+        if len(new_returns):
+            # Update a copy: the cached statistics may be in use by another thread
+            stats = stats.copy()
+            stats.update(new_returns)
+    else:
+        stats = RunningCovariance.from_returns(returns)
+    _current().put(universe, (stats, returns.iloc[stats.n - 1].to_numpy()))
+    return stats
+
+
+def _extends(returns, stats, last_row):
+    """Whether ``returns`` starts with the observations ``stats`` was built from."""
+    return (stats.last in returns.index and returns.index.get_loc(stats.last) + 1 == stats.n
+            and np.array_equal(returns.iloc[stats.n - 1].to_numpy(), last_row, equal_nan=True))
+
+
+def get_capm_return(prices):
+    """CAPM expected returns of ``prices``, shared across optimizers."""
+    from pypfopt import expected_returns
+    return _current().get(("capm_return", prices_key(prices)), lambda: expected_returns.capm_return(prices))
+
+
+def get_factor_model(prices, n_factors=10):
+    """PCA factor risk model of ``prices``, shared across optimizers."""
+    return _current().get(("pca", n_factors, prices_key(prices)), lambda: factor_model.pca_factor_model(get_returns(prices), n_factors))
+
+
+def get_factor_capm_return(prices):
+    """CAPM expected returns of ``prices`` computed without an N x N covariance, for factor-model optimizations."""
+    return _current().get(("factor_capm_return", prices_key(prices)), lambda: factor_model.capm_return(get_returns(prices)))
+
+
+def get_scenarios(prices, max_scenarios=None, method="cluster"):
+    """Reduced return scenarios of ``prices`` and their approximation report, shared by the CVaR and semivariance optimizers."""
+    return _current().get(("scenarios", max_scenarios, method, prices_key(prices)),
+                      lambda: reduce_scenarios(get_returns(prices).dropna(), max_scenarios, method))
+
+
+def prime(prices, risk_inputs):
+    """Store precomputed inputs (``{"returns"|"ledoit_wolf"|"capm_return": value}``) for ``prices``."""
+    key = prices_key(prices)
+    for kind, value in risk_inputs.items():
+        _current().put((kind, key), value)
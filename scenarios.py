@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+# Scenario cap when a request gives none; unset, the full history is used as is
+DEFAULT_MAX_SCENARIOS = int(os.environ["MAX_SCENARIOS"]) if os.environ.get("MAX_SCENARIOS") else None
+METHODS = ("lookback", "bootstrap", "cluster")
+
+
+def _stratified_sample(labels, size, rng):
+    """Rows drawn from every cluster in proportion to its size, without replacement."""
+    clusters, counts = np.unique(labels, return_counts=True)
+    quotas = counts * size / counts.sum()
+    take = np.floor(quotas).astype(int)
+    # Largest remainders get the rows left over after rounding down
+    take[np.argsort(take - quotas)[:size - take.sum()]] += 1
+    rows = [rng.choice(np.flatnonzero(labels == cluster), n, replace=False) for cluster, n in zip(clusters, take) if n]
+    return np.sort(np.concatenate(rows))
+
+
+def approximation_error(returns, reduced, frequency=252):
+    """Annualized mean and covariance errors of ``reduced`` scenarios against the full ``returns`` history."""
+    full_mean, reduced_mean = returns.mean().to_numpy(), reduced.mean().to_numpy()
+    full_cov, reduced_cov = returns.cov().to_numpy(), reduced.cov().to_numpy()
+    return {
+        "mean_error": float(np.abs(reduced_mean - full_mean).max() * frequency),
+        "covariance_error": float(np.linalg.norm(reduced_cov - full_cov) / np.linalg.norm(full_cov)),
+    }
+
+
+def reduce_scenarios(returns, max_scenarios=None, method="cluster", seed=0):
+    """
+    Compress a returns history to at most ``max_scenarios`` equally likely scenarios.
+
+    EfficientCVaR and EfficientSemivariance add a variable and a constraint per
+    scenario, so this bounds their problem size whatever the history length.
+    ``method`` is one of:
+
+    - "lookback": the most recent ``max_scenarios`` days,
+    - "bootstrap": days resampled with replacement,
+    - "cluster": days sampled across k-means clusters of the history in
+      proportion to cluster size, so calm and stressed regimes keep their share.
+
+    Sampled days remain equally weighted, as both optimizers assume. Without
+    ``max_scenarios`` (and no MAX_SCENARIOS default) nothing is reduced, since
+    a reduction changes the optimizers' results. Returns the reduced returns
+    and a report with the scenario counts and the approximation error of the
+    reduced mean and covariance.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown scenario method: {method}")
+    max_scenarios = max_scenarios or DEFAULT_MAX_SCENARIOS
+    report = {"method": method, "history": len(returns)}
+    if max_scenarios is None or len(returns) <= max_scenarios:
+        report.update({"scenarios": len(returns), "mean_error": 0.0, "covariance_error": 0.0})
+        return returns, report
+
+    rng = np.random.default_rng(seed)
+    if method == "lookback":
+        reduced = returns.iloc[-max_scenarios:]
+    elif method == "bootstrap":
+        reduced = returns.iloc[np.sort(rng.integers(0, len(returns), max_scenarios))]
+    else:
+        from sklearn.cluster import MiniBatchKMeans
+        n_clusters = min(max(max_scenarios // 20, 2), 50)
+        labels = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3).fit_predict(returns.to_numpy())
+        reduced = returns.iloc[_stratified_sample(labels, max_scenarios, rng)]
+
+    report["scenarios"] = len(reduced)
+    report.update(approximation_error(returns, reduced))
+    return reduced, report
@@ -0,0 +1,123 @@
+"""
+Sector classifications and the membership matrices of sector constraints.
+
+Classifications are bulk-loaded from a CSV file with ``ticker`` and
+``sector`` columns (plus any other metadata columns) and reloaded when the
+file changes. For a universe, the sectors present and a sectors x tickers 0/1
+membership matrix A are computed once and cached, so sector bounds become
+two vector inequalities on A @ w however many sectors and tickers there are.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from risk_cache import RiskModelCache
+
+DEFAULT_SECTORS_FILE = os.environ.get(
+    "SECTORS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sectors.csv"),
+)
+
+# Bounds applied when a request gives none; sectors without a bound are unconstrained
+DEFAULT_LOWER = {
+    "Consumer Staples": 0.1,  # at least 10% to staples
+    "Tech": 0.05,  # at least 5% to tech
+}
+DEFAULT_UPPER = {
+    "Tech": 0.2,
+    "Aerospace": 0.1,
+    "Energy": 0.1,
+    "Auto": 0.15,
+}
+
+
+def membership(tickers, sector_of):
+    """
+    Sectors present among ``tickers`` and their membership matrix.
+
+    ``sector_of`` maps tickers to sectors (a Series or dict); tickers it does
+    not classify belong to no sector.
+    """
+    codes, sectors = pd.factorize(pd.Series(sector_of, dtype=object).reindex(tickers))
+    return list(sectors), (codes[None, :] == np.arange(len(sectors))[:, None]).astype(float)
+
+
+class SectorStore:
+    """Sector (and other metadata) of each ticker, loaded from a CSV file."""
+
+    def __init__(self, path=DEFAULT_SECTORS_FILE):
+        self.path = path
+        self._version = None
+        self._metadata = pd.DataFrame(columns=["sector"])
+        self._lock = threading.Lock()
+        self._memberships = RiskModelCache(maxsize=int(os.environ.get("SECTOR_CACHE_SIZE", 32)))
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def metadata(self):
+        """Metadata frame indexed by ticker, reloaded if the file changed since it was read."""
+        version = self._file_version()
+        with self._lock:
+            if version != self._version:
+                if version is None:
+                    self._metadata = pd.DataFrame(columns=["sector"])
+                else:
+                    frame = pd.read_csv(self.path, dtype=str).dropna(subset=["ticker"])
+                    self._metadata = frame.drop_duplicates("ticker", keep="last").set_index("ticker")
+                self._version = version
+                self._memberships.clear()
+            return self._metadata
+
+    def sector_of(self):
+        """Series mapping each classified ticker to its sector."""
+        return self.metadata()["sector"]
+
+    def membership(self, tickers):
+        """Sectors of a universe and their membership matrix (see ``membership``), cached per universe."""
+        sector_of = self.sector_of()
+        return self._memberships.get(("sector_membership", tuple(tickers)), lambda: membership(tickers, sector_of))
+
+
+_store = None
+
+
+def get_store():
+    """Return the process-wide sector store, creating it on first use."""
+    global _store
+    if _store is None:
+        _store = SectorStore()
+    return _store
+
+
+def set_store(store):
+    """Replace the process-wide sector store, e.g. with one reading another file."""
+    global _store
+    _store = store
+
+
+def constraints(tickers, sector_mapper=None, sector_lower=None, sector_upper=None):
+    """
+    Sector bounds of a universe as ``(A_lower, lower, A_upper, upper)`` for A_lower @ w >= lower and A_upper @ w <= upper.
+
+    Sectors come from ``sector_mapper`` if given, else from the sector store;
+    bounds default to DEFAULT_LOWER and DEFAULT_UPPER. Bounds on sectors with
+    no ticker in the universe are dropped: a lower bound on them could never
+    be met.
+    """
+    if sector_mapper is None:
+        sectors, A = get_store().membership(tickers)
+    else:
+        sectors, A = membership(tickers, sector_mapper)
+    sectors = pd.Index(sectors, dtype=object)
+
+    def rows(bounds):
+        values = pd.Series(bounds, dtype=float).reindex(sectors).to_numpy()
+        keep = ~np.isnan(values)
+        return A[keep], values[keep]
+
+    return rows(DEFAULT_LOWER if sector_lower is None else sector_lower) + rows(DEFAULT_UPPER if sector_upper is None else sector_upper)
@@ -0,0 +1,111 @@
+"""
+Response formats: JSON, MessagePack and Arrow IPC, picked from the Accept header.
+
+Endpoints build one payload of dicts, lists, numbers and NumPy arrays and
+``respond`` encodes it in the negotiated format:
+
+- "json" (the default): arrays become lists and NaN becomes null, as the
+  endpoints always sent.
+- "msgpack" (application/msgpack): numbers stay numbers, NaN included, and
+  every NumPy array is packed as ``{"dtype", "shape", "data"}`` with its raw
+  little-endian bytes in ``data``, so a client reads a weights matrix or a
+  price panel with one ``np.frombuffer(data, dtype).reshape(shape)``. The
+  "buy N shares of X" allocation sentences are left out next to the signed
+  ``shares`` counts they describe.
+- "arrow" (application/vnd.apache.arrow.stream): one table as an Arrow IPC
+  stream, for the tabular exports.
+"""
+import numpy as np
+from flask import Response, jsonify
+
+FORMATS = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+_ALIASES = {"application/x-msgpack": "msgpack", "application/vnd.msgpack": "msgpack"}
+
+
+def negotiate(accept, offered=("json", "msgpack")):
+    """The ``offered`` format the Accept header prefers, "json" when it prefers none of them."""
+    from werkzeug.datastructures import MIMEAccept
+    from werkzeug.http import parse_accept_header
+    mimetypes = {FORMATS[fmt]: fmt for fmt in offered}
+    mimetypes.update({alias: fmt for alias, fmt in _ALIASES.items() if fmt in offered})
+    best = parse_accept_header(accept, MIMEAccept).best_match(list(mimetypes)) if accept else None
+    return mimetypes.get(best, "json")
+
+
+def to_json(value):
+    """``value`` with arrays as lists and NaN as None, ready for jsonify."""
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return np.where(np.isnan(value), None, value).tolist()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _structured(value):
+    if isinstance(value, dict):
+        return {key: _structured(item) for key, item in value.items() if not (key == "allocations" and "shares" in value)}
+    if isinstance(value, (list, tuple)):
+        return [_structured(item) for item in value]
+    return value
+
+
+def _pack_default(value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+        return {"dtype": value.dtype.str, "shape": list(value.shape), "data": value.tobytes()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def pack(payload):
+    """MessagePack bytes of ``payload``."""
+    import msgpack
+    return msgpack.packb(_structured(payload), default=_pack_default)
+
+
+def table(frame, index=None, metadata=None):
+    """Arrow IPC stream bytes of a DataFrame, its index written as a first column named ``index``; ``metadata`` values are stored as JSON."""
+    import json
+    import pyarrow as pa
+    if index is not None:
+        frame = frame.rename_axis(index).reset_index()
+    batch = pa.Table.from_pandas(frame, preserve_index=False)
+    batch = batch.replace_schema_metadata({key: json.dumps(value, default=str) for key, value in (metadata or {}).items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_table(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def respond(payload, fmt="json", frame=None, index=None):
+    """
+    Response with ``payload`` encoded as ``fmt``.
+
+    "arrow" sends ``frame`` instead (see ``table``), with the payload's
+    "errors", if any, in the schema metadata. A payload with errors is sent
+    with Cache-Control: no-store, so the failed tickers are fetched again next
+    time instead of the response being cached.
+    """
+    if fmt == "arrow":
+        metadata = {"errors": payload["errors"]} if "errors" in payload else None
+        response = Response(table(frame, index=index, metadata=metadata), mimetype=FORMATS["arrow"])
+    elif fmt == "msgpack":
+        response = Response(pack(payload), mimetype=FORMATS["msgpack"])
+    else:
+        response = jsonify(to_json(payload))
+    if payload.get("errors"):
+        response.cache_control.no_store = True
+    return response
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within a process only
+    fcntl = None
+
+DEFAULT_FLIGHT_DIR = os.environ.get(
+    "SINGLEFLIGHT_DIR",
+    os.path.join(tempfile.gettempdir(), "optimiser-singleflight"),
+)
+# How long a finished result still answers an identical request arriving just after it
+DEFAULT_WINDOW = float(os.environ.get("SINGLEFLIGHT_WINDOW", 2.0))
+DEFAULT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 120.0))
+POLL_SECONDS = 0.02
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run one computation per key at a time and hand its result to every caller
+    that asked for the same key meanwhile.
+
+    Threads of one process wait on an in-memory call. Processes (gunicorn
+    workers) coordinate through a lock file per key in ``directory``: the one
+    holding the lock computes and writes the result next to it before
+    releasing the lock, and the others wait for the lock and read that result
+    instead of computing. A result file answers for ``window`` seconds after
+    it is written, so requests arriving just after the computation finished
+    are served too; past that, or if the computation failed or ``timeout``
+    passed, a waiter computes for itself.
+
+    Results go through ``encode`` (to bytes) and ``decode`` to cross processes.
+    A result ``shareable`` rejects goes back to its own caller only: waiting
+    threads compute again and it is not written for other processes.
+    """
+
+    def __init__(self, directory=DEFAULT_FLIGHT_DIR, encode=None, decode=None, window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT, shareable=None):
+        self.directory = directory
+        self.encode = encode
+        self.decode = decode
+        self.shareable = shareable or (lambda result: True)
+        self.window = window
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._swept = 0.0
+        if fcntl is not None and encode is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def do(self, key, compute):
+        """Return ``compute()``, or the result of the identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.inc("optimiser_singleflight_total", role="thread_follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if not self.shareable(call.result):
+                return self.do(key, compute)
+            return call.result
+
+        try:
+            call.result = self._across_processes(key, compute)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _across_processes(self, key, compute):
+        if fcntl is None or self.encode is None:
+            metrics.inc("optimiser_singleflight_total", role="leader")
+            return compute()
+        lock_path, result_path = (os.path.join(self.directory, f"{key}.{ext}") for ext in ("lock", "result"))
+        lock_file, waited = self._acquire(lock_path, time.monotonic() + self.timeout)
+        if lock_file is None:
+            # The holder is stuck; compute without the lock rather than time out the request
+            metrics.inc("optimiser_singleflight_total", role="timeout")
+            return compute()
+        try:
+            result = self._read(result_path)
+            if result is not None:
+                metrics.inc("optimiser_singleflight_total", role="process_follower" if waited else "recent")
+                return result
+            metrics.inc("optimiser_singleflight_total", role="leader")
+            result = compute()
+            if self.shareable(result):
+                self._write(result_path, result)
+            return result
+        finally:
+            lock_file.close()
+            self._sweep()
+
+    @staticmethod
+    def _acquire(lock_path, deadline):
+        """Lock ``lock_path``, polling until ``deadline``; returns the locked file (or None) and whether it had to wait."""
+        waited = False
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() > deadline:
+                            lock_file.close()
+                            return None, waited
+                        waited = True
+                        time.sleep(POLL_SECONDS)
+                # The sweep may have unlinked the file while we waited on it; lock the current one instead
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file, waited
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _read(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.window:
+                return None
+            with open(path, "rb") as f:
+                return self.decode(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, result):
+        data = self.encode(result)
+        if data is None:
+            return
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def clear(self):
+        """Forget finished results, so the next request for any key computes again."""
+        if fcntl is None or self.encode is None:
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".result"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _sweep(self):
+        """Remove the files of keys not used for a while, at most once a minute."""
+        now = time.time()
+        if now - self._swept < 60:
+            return
+        self._swept = now
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) <= max(self.window, 60):
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                # Only unlink a lock file nobody holds, while holding it
+                with open(path, "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def shareable_response(entry):
+    """Whether a (status, body, mimetype, shared) response may answer other requests."""
+    return entry[3]
+
+
+def encode_response(entry):
+    """Serialize a (status, body, mimetype, shared) response; only shareable ones cross processes."""
+    status, body, mimetype, shared = entry
+    if not shared:
+        return None
+    return json.dumps({"status": status, "mimetype": mimetype}).encode() + b"\n" + body
+
+
+def decode_response(data):
+    header, body = data.split(b"\n", 1)
+    header = json.loads(header)
+    return header["status"], body, header["mimetype"], True
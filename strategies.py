@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import optimizer
+import risk_cache
+
+WORKERS = int(os.environ.get("OPTIMISER_WORKERS", os.cpu_count() or 1))
+
+
+def _risk_model(params):
+    return {"risk_model": params.get("risk_model") or "ledoit_wolf", "n_factors": params.get("n_factors") or 10}
+
+
+def _scenarios(params):
+    return {"max_scenarios": params.get("max_scenarios"), "scenario_method": params.get("scenario_method") or "cluster"}
+
+
+def _optimize_min_volatility(prices, params):
+    return optimizer.optimize_min_volatility(prices, **_risk_model(params))
+
+
+def _max_sharpe_with_sector_constraints(prices, params):
+    return optimizer.max_sharpe_with_sector_constraints(
+        prices, params.get("sector_mapper"), params.get("sector_lower"), params.get("sector_upper"))
+
+
+def _maximize_return_given_risk(prices, params):
+    return optimizer.maximize_return_given_risk(prices, params.get("target_volatility"), **_risk_model(params))
+
+
+def _minimize_risk_given_return(prices, params):
+    return optimizer.minimize_risk_given_return(prices, params.get("target_return"), **_risk_model(params))
+
+
+def _efficient_semivariance(prices, params):
+    mu = optimizer.get_expected_returns(prices)
+    return optimizer.efficient_semivariance(prices, mu, benchmark=params.get("target_return"), **_scenarios(params))
+
+
+def _efficient_cvar(prices, params):
+    mu = optimizer.get_expected_returns(prices)
+    return optimizer.efficient_cvar(prices, mu, target_cvar=params.get("target_cvar"), **_scenarios(params))
+
+
+def _optimize_hrp(prices, params):
+    return optimizer.optimize_hrp(prices)
+
+
+# Strategy name (matching its endpoint in app.py) -> (runner, risk inputs it reads from risk_cache)
+STRATEGIES = {
+    "optimize_min_volatility": (_optimize_min_volatility, ("ledoit_wolf",)),
+    "max_sharpe_with_sector_constraints": (_max_sharpe_with_sector_constraints, ("ledoit_wolf", "capm_return")),
+    "maximize_return_given_risk": (_maximize_return_given_risk, ("ledoit_wolf", "capm_return")),
+    "minimize_risk_given_return": (_minimize_risk_given_return, ("ledoit_wolf", "capm_return")),
+    "efficient_semivariance": (_efficient_semivariance, ("capm_return", "returns")),
+    "efficient_cvar": (_efficient_cvar, ("capm_return", "returns")),
+    "optimize_hrp": (_optimize_hrp, ("returns",)),
+}
+
+
+def compute_risk_inputs(prices, names):
+    """Estimate, once, every risk input the given strategies need."""
+    needed = {kind for name in names for kind in STRATEGIES[name][1]}
+    getters = {
+        "returns": risk_cache.get_returns,
+        "ledoit_wolf": risk_cache.get_covariance,
+        "capm_return": risk_cache.get_capm_return,
+    }
+    return {kind: getters[kind](prices) for kind in needed}
+
+
+def run_strategy(name, prices, params, total_portfolio_value, risk_inputs=None):
+    """
+    Run one strategy and its discrete allocation.
+
+    ``risk_inputs`` (as returned by compute_risk_inputs) are primed into the
+    risk cache first, so a strategy running in a worker process reuses the
+    estimates made by the parent instead of recomputing them.
+    """
+    if risk_inputs:
+        risk_cache.prime(prices, risk_inputs)
+    runner = STRATEGIES[name][0]
+    try:
+        weights, performance_data = runner(prices, params)
+        shares, leftover = optimizer.discrete_allocation(weights, prices, total_portfolio_value=total_portfolio_value,
+                                                         method=params.get("allocation_method") or "lp")
+    except Exception as e:
+        # One infeasible target should not fail the other strategies of a batch
+        return {"weights": {}, "allocations": {}, "shares": {}, "leftover": 0, "performance": {}, "message": str(e)}
+    result = {
+        "weights": dict(weights),
+        "allocations": optimizer.format_allocations(shares),
+        "shares": shares,
+        "leftover": leftover,
+        "performance": performance_data['MVO'],
+    }
+    for extra in ("scenarios", "hrp"):
+        if extra in performance_data:
+            result[extra] = performance_data[extra]
+    return result
+
+
+_pool = None
+
+
+def get_pool():
+    """Return the process pool used for running strategies in parallel, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+def run_strategies(names, prices, params, total_portfolio_value, parallel=True):
+    """Run several strategies on the same prices, sharing one set of risk estimates."""
+    risk_inputs = compute_risk_inputs(prices, names)
+    if not parallel or len(names) < 2:
+        return {name: run_strategy(name, prices, params, total_portfolio_value) for name in names}
+    pool = get_pool()
+    futures = {name: pool.submit(run_strategy, name, prices, params, total_portfolio_value, risk_inputs) for name in names}
+    return {name: future.result() for name, future in futures.items()}
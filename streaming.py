@@ -0,0 +1,91 @@
+import os
+import json
+import queue
+import threading
+import metrics
+from serialization import to_json
+
+HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT", 5))
+FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+_DONE = object()
+
+
+class Cancelled(Exception):
+    """Raised inside streamed work once its client has gone away."""
+
+
+def _default(value):
+    # numpy scalars and arrays
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+def encode(event, fmt="ndjson"):
+    """One event as an NDJSON line or a Server-Sent Events message."""
+    data = json.dumps(to_json(event), default=_default)
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def negotiate(accept):
+    """"sse" when the Accept header asks for text/event-stream, "ndjson" otherwise."""
+    return "sse" if accept and "text/event-stream" in accept else "ndjson"
+
+
+class ProgressStream:
+    """
+    Run ``work(emit)`` on a background thread and iterate over the events it emits.
+
+    ``emit(event, **data)`` queues ``{"event": event, **data}``; every stage
+    timed with metrics.stage on the work thread is emitted too, as a "stage"
+    event when it starts and ends. While the work is quiet a "heartbeat" is
+    yielded every ``heartbeat`` seconds so proxies keep the connection open and
+    a client that went away is noticed on the next write. Closing the iterator
+    (which the WSGI server does when the client disconnects) cancels the work:
+    its next emit or stage boundary raises Cancelled. A stage already running,
+    e.g. a solve, is not interrupted.
+    """
+
+    def __init__(self, work, fmt="ndjson", heartbeat=None):
+        self.work = work
+        self.fmt = fmt
+        self.heartbeat = heartbeat or HEARTBEAT_SECONDS
+        self.cancelled = threading.Event()
+        self._events = queue.Queue()
+
+    def emit(self, event, **data):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        self._events.put({"event": event, **data})
+
+    def _on_stage(self, stage, seconds):
+        if seconds is None:
+            self.emit("stage", stage=stage, status="started")
+        else:
+            self.emit("stage", stage=stage, status="finished", seconds=seconds)
+
+    def _run(self):
+        try:
+            with metrics.listen(self._on_stage):
+                self.work(self.emit)
+        except Cancelled:
+            metrics.inc("optimiser_stream_cancelled_total")
+        except Exception as e:
+            self._events.put({"event": "error", "error": str(e)})
+        finally:
+            self._events.put(_DONE)
+
+    def __iter__(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        try:
+            while True:
+                try:
+                    event = self._events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    event = {"event": "heartbeat"}
+                if event is _DONE:
+                    return
+                yield encode(event, self.fmt)
+        finally:
+            self.cancelled.set()
@@ -79,79 +79,137 @@ function displayAllocations(data) {
 }
 
 
-function optimizeMinVolatility() {
-    const formData = new FormData(document.getElementById("minVolatilityForm"));
-    const tickers = formData.get("tickers").split(",");
-    const totalPortfolioValue = parseInt(formData.get("totalPortfolioValue"));
-
-    fetch("http://127.0.0.1:5000/optimize_min_volatility", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json"
-        },
-        body: JSON.stringify({ tickers: tickers, total_portfolio_value: totalPortfolioValue })
-    })
-    .then(response => response.json())
-    .then(data => {
-        console.log(data)
-        displayAllocations(data);
-
-    });
+function displayProgress(lines) {
+    document.getElementById("allocationsCard").innerHTML = `
+        <div class="card">
+            <div class="card-header">
+                Progress
+            </div>
+            <div class="card-body">
+                <ul class="list-group">
+                    ${lines.map(line => `<li class="list-group-item">${line}</li>`).join("")}
+                </ul>
+            </div>
+        </div>
+    `;
 }
 
-function optimizeMaxSharpe() {
-    const formData = new FormData(document.getElementById("maxSharpeForm"));
-    const tickers = formData.get("tickers").split(",");
+// POST to the streaming variant of an endpoint (/stream/<strategy>), showing
+// downloads and stages as they happen; resolves with the endpoint's payload.
+function streamStrategy(strategy, payload) {
+    const lines = [];
+    const handle = event => {
+        if (event.event === "ticker") {
+            lines.push(event.error
+                ? `${event.ticker} failed (${event.done}/${event.total}): ${event.error}`
+                : `Loaded ${event.ticker} (${event.done}/${event.total})`);
+        } else if (event.event === "stage" && event.status === "started") {
+            lines.push(`Running ${event.stage}...`);
+        } else if (event.event === "error") {
+            throw new Error(event.error);
+        }
+        displayProgress(lines);
+        return event.event === "result" ? event : null;
+    };
 
-    fetch("http://127.0.0.1:5000/max_sharpe_with_sector_constraints", {
+    return fetch(`http://127.0.0.1:5000/stream/${strategy}`, {
         method: "POST",
         headers: {
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept": "application/x-ndjson"
         },
-        body: JSON.stringify({ tickers: tickers })
+        body: JSON.stringify(payload)
     })
-    .then(response => response.json())
-    .then(data => {
-        displayAllocations(data);
-
+    .then(async response => {
+        if (!response.ok) {
+            throw new Error("Failed to fetch data. Status: " + response.status);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let result = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split("\n");
+            buffer = events.pop();
+            for (const line of events.filter(line => line.trim())) {
+                result = handle(JSON.parse(line)) || result;
+            }
+        }
+        if (!result) {
+            throw new Error("The stream ended without a result");
+        }
+        return result;
     });
 }
 
-function maximizeReturnGivenRisk() {
-    const formData = new FormData(document.getElementById("maximizeReturnGivenRiskForm"));
-    const tickers = formData.get("tickers").split(",");
-    const targetVolatility = parseFloat(formData.get("targetVolatility"));
+// POST to an endpoint and resolve with its payload. The plain endpoints are
+// served from the response cache and coalesced with identical requests, so the
+// dashboard uses them unless STREAM_PROGRESS asks for the uncached stream.
+const STREAM_PROGRESS = false;
 
-    fetch("http://127.0.0.1:5000/maximize_return_given_risk", {
+function postStrategy(strategy, payload) {
+    return fetch(`http://127.0.0.1:5000/${strategy}`, {
         method: "POST",
         headers: {
             "Content-Type": "application/json"
         },
-        body: JSON.stringify({ tickers: tickers, target_volatility: targetVolatility })
+        body: JSON.stringify(payload)
     })
-
     .then(response => {
         if (!response.ok) {
             throw new Error("Failed to fetch data. Status: " + response.status);
         }
         return response.json();
-    })
+    });
+}
+
+function runStrategy(strategy, payload) {
+    return STREAM_PROGRESS ? streamStrategy(strategy, payload) : postStrategy(strategy, payload);
+}
+
+function showResult(promise) {
+    promise
     .then(data => {
         if (data.message) {
             // Display error message on the frontend
             displayErrorMessage(data.message);
         } else {
-            // Process and display data as usual
             displayAllocations(data);
-            console.log(data);
         }
     })
     .catch(error => {
-        // Handle generic error (e.g., network issues)
         displayErrorMessage("An error occurred: " + error.message);
     });
 }
 
+function optimizeMinVolatility() {
+    const formData = new FormData(document.getElementById("minVolatilityForm"));
+    const tickers = formData.get("tickers").split(",");
+    const totalPortfolioValue = parseInt(formData.get("totalPortfolioValue"));
+
+    showResult(runStrategy("optimize_min_volatility", { tickers: tickers, total_portfolio_value: totalPortfolioValue }));
+}
+
+function optimizeMaxSharpe() {
+    const formData = new FormData(document.getElementById("maxSharpeForm"));
+    const tickers = formData.get("tickers").split(",");
+
+    showResult(runStrategy("max_sharpe_with_sector_constraints", { tickers: tickers }));
+}
+
+function maximizeReturnGivenRisk() {
+    const formData = new FormData(document.getElementById("maximizeReturnGivenRiskForm"));
+    const tickers = formData.get("tickers").split(",");
+    const targetVolatility = parseFloat(formData.get("targetVolatility"));
+
+    showResult(runStrategy("maximize_return_given_risk", { tickers: tickers, target_volatility: targetVolatility }));
+}
+
 function displayErrorMessage(message) {
     // Display the error message on the frontend (e.g., in a div with id="error-message")
     document.getElementById("error-message").innerText = message;
@@ -163,18 +221,7 @@ function minimizeRiskGivenReturn() {
     const tickers = formData.get("tickers").split(",");
     const targetReturn = parseFloat(formData.get("targetReturn"));
 
-    fetch("http://127.0.0.1:5000/minimize_risk_given_return", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json"
-        },
-        body: JSON.stringify({ tickers: tickers, target_return: targetReturn })
-    })
-    .then(response => response.json())
-    .then(data => {
-        displayAllocations(data);
-
-    });
+    showResult(runStrategy("minimize_risk_given_return", { tickers: tickers, target_return: targetReturn }));
 }
 
 function efficientSemivariance() {
@@ -182,18 +229,7 @@ function efficientSemivariance() {
     const tickers = formData.get("tickers").split(",");
     const targetReturn = parseFloat(formData.get("targetReturn"));
 
-    fetch("http://127.0.0.1:5000/efficient_semivariance", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json"
-        },
-        body: JSON.stringify({ tickers: tickers, target_return: targetReturn })
-    })
-    .then(response => response.json())
-    .then(data => {
-        displayAllocations(data);
-
-    });
+    showResult(runStrategy("efficient_semivariance", { tickers: tickers, target_return: targetReturn }));
 }
 
 function efficientCVaR() {
@@ -201,18 +237,7 @@ function efficientCVaR() {
     const tickers = formData.get("tickers").split(",");
     const targetCVaR = parseFloat(formData.get("targetCVaR"));
 
-    fetch("http://127.0.0.1:5000/efficient_cvar", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json"
-        },
-        body: JSON.stringify({ tickers: tickers, target_cvar: targetCVaR })
-    })
-    .then(response => response.json())
-    .then(data => {
-        displayAllocations(data);
-
-    });
+    showResult(runStrategy("efficient_cvar", { tickers: tickers, target_cvar: targetCVaR }));
 }
 
 function optimizeHRP() {
@@ -226,22 +251,7 @@ function optimizeHRP() {
         })
     };
 
-    // Send POST request to API endpoint
-    fetch("http://127.0.0.1:5000/optimize_hrp", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json"
-        },
-        body: JSON.stringify(payload)
-    })
-    .then(response => response.json())
-    .then(data => {
-        // Display allocations card
-        displayAllocations(data);
-    })
-    .catch(error => {
-        console.error("Error:", error);
-    });
+    showResult(runStrategy("optimize_hrp", payload));
 }
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -0,0 +1,134 @@
+"""
+Startup warm-up for gunicorn.
+
+The heavy libraries (PyPortfolioOpt, cvxpy and its solvers, scikit-learn,
+yfinance) are imported on first use, so a worker that is spawned or restarted
+without preloading starts quickly. With ``preload_app`` (see gunicorn.conf.py)
+the master instead calls ``preload()`` once before forking: it imports those
+libraries, reads the price store into memory and runs every strategy on a small
+synthetic panel so solver code paths are loaded, and the forked workers share
+all of it copy-on-write.
+
+    python warmup.py            # cold import time and memory of app.py
+    python warmup.py --preload  # the same after a full preload
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import contextlib
+import metrics
+
+HEAVY_MODULES = ("cvxpy", "pypfopt", "sklearn.cluster", "sklearn.utils.extmath", "yfinance")
+
+_started = time.perf_counter()
+_ready = None
+
+
+def mark_start():
+    """Restart the startup clock, e.g. in a freshly forked worker."""
+    global _started, _ready
+    _started, _ready = time.perf_counter(), None
+
+
+def mark_ready():
+    """Stop the startup clock; returns the startup time in seconds."""
+    global _ready
+    _ready = time.perf_counter() - _started
+    return _ready
+
+
+def memory():
+    """
+    Resident and shared memory of this process in bytes, from /proc (zeros where unavailable).
+
+    Shared memory counts every page also mapped by another process, including
+    the pages a forked worker still shares copy-on-write with the master.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.endswith("kB\n")}
+    except OSError:
+        return {"resident": 0, "shared": 0}
+    return {"resident": fields.get("Rss", 0), "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)}
+
+
+def import_heavy_modules():
+    import importlib
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Warm-up could not import {name}: {e}")
+
+
+def warm_solvers(n_tickers=20, n_days=300):
+    """
+    Run every strategy once on a synthetic panel.
+
+    The history is kept below the scenario limit so no k-means (and its
+    thread pool) runs before forking. Metrics are switched off meanwhile and
+    the risk cache is cleared afterwards, so warm-up leaves no trace in either.
+    """
+    import risk_cache
+    from benchmark import synthetic_prices, synthetic_sectors
+    from strategies import STRATEGIES, run_strategy
+
+    prices = synthetic_prices(n_tickers, n_days, seed=1)
+    sector_mapper, sector_lower, sector_upper = synthetic_sectors(list(prices.columns))
+    params = {"sector_mapper": sector_mapper, "sector_lower": sector_lower, "sector_upper": sector_upper,
+              "target_volatility": 0.3, "target_return": 0.1, "target_cvar": 0.1}
+    enabled, metrics.ENABLED = metrics.ENABLED, False
+    try:
+        # The optimizers print their performance; keep that out of the startup log
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in STRATEGIES:
+                run_strategy(name, prices, params, total_portfolio_value=10000)
+    finally:
+        metrics.ENABLED = enabled
+        risk_cache.clear_cache()
+
+
+def preload(store=None, warm=True):
+    """Import the heavy modules, read the price store into memory and warm the solvers; returns a summary."""
+    from price_store import get_store
+    start = time.perf_counter()
+    import_heavy_modules()
+    tickers = (store or get_store()).preload()
+    if warm:
+        warm_solvers()
+    return {"tickers": tickers, "seconds": time.perf_counter() - start}
+
+
+def report(role):
+    mem = memory()
+    startup = _ready if _ready is not None else time.perf_counter() - _started
+    return (f"{role} pid {os.getpid()}: started in {startup:.2f}s, "
+            f"{mem['resident'] / 2**20:.0f} MiB resident ({mem['shared'] / 2**20:.0f} MiB shared)")
+
+
+metrics.registry.register_collector(lambda: [
+    ("optimiser_startup_seconds", "gauge", {}, _ready if _ready is not None else 0.0),
+    ("optimiser_resident_memory_bytes", "gauge", {}, memory()["resident"]),
+    ("optimiser_shared_memory_bytes", "gauge", {}, memory()["shared"]),
+])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the startup time and memory of the app.")
+    parser.add_argument("--preload", action="store_true", help="also preload the price store and warm the solvers")
+    args = parser.parse_args(argv)
+    mark_start()
+    import app  # noqa: F401
+    print(f"import app: {time.perf_counter() - _started:.2f}s")
+    if args.preload:
+        summary = preload()
+        print(f"preload: {summary['seconds']:.2f}s, {summary['tickers']} stored tickers")
+    mark_ready()
+    print(report("process"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())